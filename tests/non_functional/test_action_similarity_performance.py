@@ -0,0 +1,107 @@
+"""
+Microbenchmarks of the detection of repetitive actions, comparing the incremental `ActionRepetitionDetector` with
+computing `textdistance.jaccard` against the recent actions on every call, as was done before.
+"""
+
+import itertools
+import random
+import timeit
+
+import pytest
+
+import logging
+logger = logging.getLogger("tinytroupe")
+
+import sys
+sys.path.insert(0, '../../tinytroupe/')
+sys.path.insert(0, '../../')
+sys.path.insert(0, '..')
+
+from testing_utils import *
+
+from tinytroupe.examples import create_oscar_the_architect
+from tinytroupe.utils.behavior import ActionRepetitionDetector, _compute_single_action_jaccard_similarity
+
+WORDS = ("I think we should review the architectural plans for the new library building before the meeting with the "
+         "city council next week because the budget is tight and the deadlines are close").split()
+
+
+def _random_action(rng):
+    return {"type": "TALK", "target": "",
+            "content": " ".join(rng.choices(WORDS, k=rng.randint(20, 60)))}
+
+
+def _per_call_microseconds(function, repetitions=200):
+    return min(timeit.repeat(function, number=repetitions, repeat=5)) / repetitions * 1e6
+
+
+def _detector_with_actions(rng, window):
+    actions = [_random_action(rng) for _ in range(window)]
+
+    detector = ActionRepetitionDetector(window_size=window)
+    for action in actions:
+        detector.add(action)
+
+    return detector, actions
+
+
+@pytest.mark.parametrize("window", [1, 10])
+def test_detector_matches_textdistance(window):
+    rng = random.Random(0)
+    detector, actions = _detector_with_actions(rng, window)
+
+    for proposed in [_random_action(rng) for _ in range(100)]:
+        assert detector.max_similarity(proposed) == pytest.approx(
+            max(_compute_single_action_jaccard_similarity(action, proposed) for action in actions)
+        )
+
+
+# with a single recent action, there is little to gain, so the timings are only reported
+@pytest.mark.parametrize("window, minimum_speedup", [(1, None), (10, 2)])
+def test_detector_vs_textdistance(window, minimum_speedup):
+    rng = random.Random(0)
+    detector, actions = _detector_with_actions(rng, window)
+    proposals = [_random_action(rng) for _ in range(100)]
+
+    # a different proposed action every time, so that nothing is reused across calls
+    reference_proposals = itertools.cycle(proposals)
+    incremental_proposals = itertools.cycle(proposals)
+
+    def reference():
+        proposed = next(reference_proposals)
+        return max(_compute_single_action_jaccard_similarity(action, proposed) for action in actions)
+
+    def incremental():
+        return detector.max_similarity(next(incremental_proposals))
+
+    reference_time = _per_call_microseconds(reference)
+    incremental_time = _per_call_microseconds(incremental)
+    print(f"\nWindow of {window} action(s): textdistance {reference_time:.1f} us/call, "
+          f"detector {incremental_time:.1f} us/call ({reference_time / incremental_time:.1f}x)")
+
+    if minimum_speedup is not None:
+        assert reference_time / incremental_time > minimum_speedup
+
+
+def test_agent_similarity_check_with_long_history(setup):
+    """
+    The similarity check of agents must not get slower as they accumulate actions in episodic memory.
+    """
+    rng = random.Random(1)
+    agent = create_oscar_the_architect()
+    proposals = itertools.cycle([_random_action(rng) for _ in range(100)])
+
+    times = {}
+    for history_length in [10, 1000]:
+        while agent.episodic_memory.count(item_type="action") < history_length:
+            agent.episodic_memory.store({"role": "assistant", "content": {"action": _random_action(rng)},
+                                         "type": "action", "simulation_timestamp": None})
+            agent.episodic_memory.store({"role": "assistant", "content": {"action": {"type": "DONE", "content": "", "target": ""}},
+                                         "type": "action", "simulation_timestamp": None})
+            agent.episodic_memory.commit_episode()
+
+        agent.recent_action_similarity(next(proposals))
+        times[history_length] = _per_call_microseconds(lambda: agent.recent_action_similarity(next(proposals)))
+        print(f"\nHistory of {history_length} actions: {times[history_length]:.1f} us/call")
+
+    assert times[1000] < 5 * times[10]
@@ -193,6 +193,137 @@ def get_relative_to_test_path(path_suffix):
 # Fixtures
 ############################################################################################################
 
+class FakeOpenAIServer:
+    """
+    A minimal local server implementing the OpenAI chat completions endpoint, so that the client code paths
+    (including the asynchronous ones) can be tested offline. Responses are produced by `responder`, a function that
+    receives the request body (as a dict) and returns the content of the assistant message. Extra response headers
+    can be given in `headers`, and `error_statuses` lists HTTP error statuses to return (in order) before succeeding.
+    The embeddings endpoint is also available, returning a small deterministic vector for each input text.
+    """
+
+    def __init__(self, responder=None, delay=0.0):
+        import threading
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+        self.responder = responder if responder is not None else (lambda request: "Hello from the fake server!")
+        self.delay = delay
+        self.headers = {}
+        self.error_statuses = []
+        self.requests = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self._lock = threading.Lock()
+
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_POST(self):
+                import json
+                import time
+
+                body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+                with server._lock:
+                    server.requests.append(body)
+                    server.in_flight += 1
+                    server.max_in_flight = max(server.max_in_flight, server.in_flight)
+
+                try:
+                    if server.delay > 0:
+                        time.sleep(server.delay)
+                    content = server.responder(body)
+                finally:
+                    with server._lock:
+                        server.in_flight -= 1
+                        error_status = server.error_statuses.pop(0) if server.error_statuses else None
+
+                if error_status is not None:
+                    error = json.dumps({"error": {"message": "Fake error.", "type": "fake_error"}}).encode("utf-8")
+                    self.send_response(error_status)
+                    self.send_header("Content-Type", "application/json")
+                    self.send_header("Content-Length", str(len(error)))
+                    for name, value in server.headers.items():
+                        self.send_header(name, value)
+                    self.end_headers()
+                    self.wfile.write(error)
+                    return
+
+                if self.path.endswith("/embeddings"):
+                    texts = body["input"] if isinstance(body["input"], list) else [body["input"]]
+                    payload = json.dumps({
+                        "object": "list",
+                        "model": body.get("model", "fake-model"),
+                        "data": [{"object": "embedding", "index": i, "embedding": FakeOpenAIServer.fake_embedding(text)}
+                                 for i, text in enumerate(texts)],
+                        "usage": {"prompt_tokens": len(texts), "total_tokens": len(texts)},
+                    }).encode("utf-8")
+                else:
+                    payload = json.dumps({
+                        "id": f"chatcmpl-fake-{len(server.requests)}",
+                        "object": "chat.completion",
+                        "created": 0,
+                        "model": body.get("model", "fake-model"),
+                        "choices": [{"index": 0, "finish_reason": "stop",
+                                     "message": {"role": "assistant", "content": content}}],
+                        "usage": {"prompt_tokens": 10, "completion_tokens": 5, "total_tokens": 15,
+                                  "prompt_tokens_details": {"cached_tokens": 4}},
+                    }).encode("utf-8")
+
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                for name, value in server.headers.items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def log_message(self, format, *args):
+                pass  # keep the test output clean
+
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    @staticmethod
+    def fake_embedding(text):
+        return [float(len(text)), float(sum(map(ord, text)) % 97), 1.0]
+
+    @property
+    def base_url(self):
+        return f"http://127.0.0.1:{self._server.server_address[1]}/v1"
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+
+@pytest.fixture(scope="function")
+def fake_openai_server(monkeypatch):
+    """
+    Starts a local fake OpenAI server and points the OpenAI clients to it.
+    """
+    from tinytroupe import config_manager
+
+    server = FakeOpenAIServer().start()
+    monkeypatch.setenv("OPENAI_API_KEY", "fake-key")
+    monkeypatch.setenv("OPENAI_BASE_URL", server.base_url)
+
+    # no need to throttle requests to a local server
+    original_waiting_time = config_manager.get("waiting_time")
+    config_manager.update("waiting_time", 0)
+
+    yield server
+
+    config_manager.update("waiting_time", original_waiting_time)
+    server.stop()
+
+
 @pytest.fixture(scope="function")
 def focus_group_world():
     import tinytroupe.examples as examples   
@@ -1,5 +1,7 @@
 import json
 import logging
+import time
+from types import SimpleNamespace
 from unittest.mock import MagicMock, Mock, patch
 
 import pytest
@@ -16,6 +18,8 @@ from testing_utils import *
 
 from tinytroupe.agent import TinyPerson
 from tinytroupe.agent.action_generator import ActionGenerator
+from tinytroupe.clients import client
+from tinytroupe.experimentation import Proposition
 from tinytroupe.examples import (
     create_lisa_the_data_scientist,
     create_oscar_the_architect,
@@ -425,6 +429,144 @@ def test_action_generator_serialization():
     assert new_generator.quality_threshold == generator.quality_threshold
 
 
+class _FakeScoringChat:
+    """
+    Stands in for the LLM chats that score propositions, taking a while to answer, and reporting the usage of the
+    model call to the client, as a model would.
+    """
+
+    LATENCY = 0.3
+    USAGE = SimpleNamespace(prompt_tokens=100, completion_tokens=20, total_tokens=120,
+                            prompt_tokens_details=SimpleNamespace(cached_tokens=64))
+
+    def __init__(self, system_prompt=None, user_prompt=None, output_type=None, **model_params):
+        self.messages = [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": user_prompt},
+        ]
+        self.output_type = output_type
+
+    def __call__(self):
+        time.sleep(_FakeScoringChat.LATENCY)
+        client()._update_cost_stats(SimpleNamespace(usage=_FakeScoringChat.USAGE), was_cached=False)
+
+        if self.output_type is int:
+            self.response_json = {"reasoning": "Looks fine.", "justification": "Fine.", "value": 8, "confidence": 0.9}
+            self.response_reasoning = self.response_json["reasoning"]
+            self.response_justification = self.response_json["justification"]
+            self.response_confidence = self.response_json["confidence"]
+            return 8
+
+        # a multi-rubric call, which scores all propositions given at once
+        n_propositions = self.messages[1]["content"].count("## Proposition ")
+        self.response_json = {
+            "reasoning": "Looks fine.",
+            "scores": [
+                {"proposition": i + 1, "justification": f"Fine ({i + 1}).", "value": 8 - i, "confidence": 0.9}
+                for i in range(n_propositions)
+            ],
+        }
+        return self.response_json
+
+
+def _quality_checked_generator(quality_threshold=5, **kwargs):
+    return ActionGenerator(
+        enable_quality_checks=True,
+        enable_quality_check_for_persona_adherence=True,
+        enable_quality_check_for_selfconsistency=True,
+        enable_quality_check_for_fluency=True,
+        enable_quality_check_for_suitability=True,
+        quality_threshold=quality_threshold,
+        **kwargs,
+    )
+
+
+@pytest.mark.core
+@pytest.mark.parametrize("enable_parallel_quality_checks", [True, False])
+def test_action_generator_parallel_quality_checks(enable_parallel_quality_checks):
+    """Quality checks run concurrently, rendering the agent's trajectory only once for all of them."""
+
+    agent = create_unique_oscar("_parallel_checks")
+    agent.actions_count = 1
+    generator = _quality_checked_generator(enable_parallel_quality_checks=enable_parallel_quality_checks)
+
+    action = {"type": "TALK", "content": "I would start with the site survey.", "target": ""}
+    with patch("tinytroupe.experimentation.proposition.LLMChat", _FakeScoringChat), patch.object(
+        agent, "pretty_current_interactions", wraps=agent.pretty_current_interactions
+    ) as pretty_current_interactions:
+        start = time.time()
+        good_quality, total_score, feedback = generator._check_action_quality("Test", agent, action)
+        elapsed = time.time() - start
+
+    assert good_quality
+    assert total_score == 4 * 8
+    assert pretty_current_interactions.call_count == 1
+
+    if enable_parallel_quality_checks:
+        assert elapsed < 2 * _FakeScoringChat.LATENCY
+    else:
+        assert elapsed >= 4 * _FakeScoringChat.LATENCY
+
+    stats = generator.get_statistics()
+    assert stats["total_quality_checks"] == 1
+    assert set(stats["quality_checks"]) == {"persona_adherence", "self_consistency", "fluency", "suitability"}
+    for check_stats in stats["quality_checks"].values():
+        assert check_stats["evaluations"] == 1
+        assert check_stats["model_calls"] == 1
+        assert check_stats["mean_latency"] >= _FakeScoringChat.LATENCY
+
+        # the usage of each check's own call, even when checks run concurrently
+        assert check_stats["input_tokens"] == 100
+        assert check_stats["cached_input_tokens"] == 64
+        assert check_stats["output_tokens"] == 20
+        assert check_stats["total_tokens"] == 120
+
+
+@pytest.mark.core
+def test_action_generator_multi_rubric_quality_check():
+    """With a multi-rubric check, all propositions are scored in a single call, each with its own score."""
+
+    agent = create_unique_oscar("_multi_rubric")
+    agent.actions_count = 1
+    generator = _quality_checked_generator(enable_multi_rubric_quality_check=True, quality_threshold=7)
+
+    action = {"type": "TALK", "content": "I would start with the site survey.", "target": ""}
+    with patch("tinytroupe.experimentation.proposition.LLMChat", _FakeScoringChat):
+        good_quality, total_score, feedback = generator._check_action_quality("Test", agent, action)
+
+    # the propositions are scored 8, 7, 6 and 5, in order, so fluency and suitability fail
+    assert not good_quality
+    assert total_score == 8 + 7 + 6 + 5
+    assert "The action is not fluent" in feedback
+    assert "The action is not suitable" in feedback
+    assert "does not adhere to the persona" not in feedback
+    assert generator.action_fluency.justification == "Fine (3)."
+
+    stats = generator.get_statistics()
+    assert set(stats["quality_checks"]) == {"multi_rubric"}
+    assert stats["quality_checks"]["multi_rubric"]["model_calls"] == 1
+    assert stats["quality_checks"]["multi_rubric"]["total_tokens"] == 120
+
+
+@pytest.mark.core
+def test_action_generator_quality_checks_with_false_preconditions():
+    """Propositions whose preconditions are false pass without any model call, also in a multi-rubric check."""
+
+    agent = create_unique_oscar("_false_preconditions")
+    agent.actions_count = 1
+    action = {"type": "REACH_OUT", "content": "", "target": "Lisa"}
+
+    for enable_multi_rubric_quality_check in [False, True]:
+        generator = _quality_checked_generator(enable_multi_rubric_quality_check=enable_multi_rubric_quality_check)
+
+        with patch("tinytroupe.experimentation.proposition.LLMChat", _FakeScoringChat):
+            good_quality, total_score, feedback = generator._check_action_quality("Test", agent, action)
+
+        assert good_quality
+        assert total_score == 4 * Proposition.MAX_SCORE
+        assert all(check_stats["model_calls"] == 0 for check_stats in generator.get_statistics()["quality_checks"].values())
+
+
 def test_action_generator_error_handling():
     """Test ActionGenerator error handling and edge cases."""
 
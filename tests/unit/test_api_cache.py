@@ -7,9 +7,21 @@ ensuring API responses can be persisted to disk and reloaded.
 import os
 import pickle
 import tempfile
+from unittest.mock import patch
 import pytest
 
 from tinytroupe.clients.openai_client import OpenAIClient
+from tinytroupe.clients.api_cache import (
+    CACHE_BACKEND_SHARDED_LOG,
+    PickleAPICache,
+    ShardedLogAPICache,
+    create_api_cache,
+    legacy_request_cache_key,
+    make_cache_entry,
+    rekey_legacy_entries,
+    request_cache_key,
+    unpack_cache_entry,
+)
 
 
 class TestOpenAIClientCache:
@@ -211,3 +223,305 @@ class TestOpenAIClientCache:
         client = OpenAIClient(cache_api_calls=True, cache_file_name=temp_cache_file)
         
         assert client.api_cache == {}
+
+
+class TestShardedLogAPICache:
+    """Tests for the append-only, sharded log cache backend."""
+
+    @pytest.fixture
+    def temp_cache_dir(self):
+        """Creates a temporary directory for the cache shards."""
+        with tempfile.TemporaryDirectory() as path:
+            yield path
+
+    @pytest.mark.core
+    def test_roundtrip_across_instances(self, temp_cache_dir):
+        """Test that entries written by one instance are read back by a new one."""
+        cache_dir = os.path.join(temp_cache_dir, "cache.d")
+        cache1 = ShardedLogAPICache(cache_dir, num_shards=4)
+        for i in range(50):
+            cache1[f"key_{i}"] = {"value": i, "text": "Hello 世界 🌍"}
+        cache1.close()
+
+        cache2 = ShardedLogAPICache(cache_dir)
+        assert cache2.num_shards == 4
+        assert len(cache2) == 50
+        assert cache2["key_7"] == {"value": 7, "text": "Hello 世界 🌍"}
+        assert "key_49" in cache2
+        assert "missing" not in cache2
+        assert cache2.get("missing") is None
+        cache2.close()
+
+    def test_writes_only_append(self, temp_cache_dir):
+        """Test that adding an entry appends to a single shard instead of rewriting the cache."""
+        cache_dir = os.path.join(temp_cache_dir, "cache.d")
+        cache = ShardedLogAPICache(cache_dir, num_shards=1)
+        cache["a"] = "x" * 1000
+        size_before = os.path.getsize(os.path.join(cache_dir, "shard-000.log"))
+
+        cache["b"] = "y"
+        size_after = os.path.getsize(os.path.join(cache_dir, "shard-000.log"))
+
+        # only the new (small) record was written
+        assert 0 < size_after - size_before < 100
+        cache.close()
+
+    def test_flush_does_not_sync_every_entry(self, temp_cache_dir):
+        """Test that flushing after each new entry does not sync shards to disk, which is left to close."""
+        cache_dir = os.path.join(temp_cache_dir, "cache.d")
+        cache = ShardedLogAPICache(cache_dir, num_shards=4)
+
+        with patch("tinytroupe.clients.api_cache.os.fsync") as fsync:
+            for i in range(20):
+                cache[f"key_{i}"] = i
+                cache.flush()
+            assert fsync.call_count == 0
+
+            # entries are visible to other instances (e.g., other processes) nonetheless
+            other = ShardedLogAPICache(cache_dir)
+            assert len(other) == 20
+            other.close()
+
+            cache.close()
+            # only the shards written are synced, once each
+            assert fsync.call_count == len({cache._shard_for(cache._encode_key(f"key_{i}")) for i in range(20)})
+
+    def test_overwrite_and_compaction(self, temp_cache_dir):
+        """Test that overwritten entries are reclaimed by compaction."""
+        cache_dir = os.path.join(temp_cache_dir, "cache.d")
+        cache = ShardedLogAPICache(cache_dir, num_shards=1)
+        for i in range(10):
+            cache["key"] = "v" * 100 + str(i)
+        shard_path = os.path.join(cache_dir, "shard-000.log")
+        size_before = os.path.getsize(shard_path)
+
+        cache.compact()
+
+        assert os.path.getsize(shard_path) < size_before
+        assert cache["key"] == "v" * 100 + "9"
+        assert len(cache) == 1
+
+        del cache["key"]
+        assert "key" not in cache
+        cache.close()
+
+    def test_delete_many_rewrites_each_shard_once(self, temp_cache_dir):
+        """Test that deleting many entries at once compacts each shard only once."""
+        cache_dir = os.path.join(temp_cache_dir, "cache.d")
+        cache = ShardedLogAPICache(cache_dir, num_shards=2)
+        for i in range(20):
+            cache[f"key_{i}"] = i
+
+        with patch.object(ShardedLogAPICache, "_compact_shard", autospec=True,
+                          side_effect=ShardedLogAPICache._compact_shard) as compact_shard:
+            cache.delete_many([f"key_{i}" for i in range(10)] + ["missing"])
+
+        assert compact_shard.call_count <= 2
+        assert len(cache) == 10
+        assert "key_3" not in cache
+        assert cache["key_15"] == 15
+        cache.close()
+
+        assert len(ShardedLogAPICache(cache_dir)) == 10
+
+    def test_truncated_record_is_discarded(self, temp_cache_dir):
+        """Test that a partially written record (e.g., after a crash) does not corrupt the cache."""
+        cache_dir = os.path.join(temp_cache_dir, "cache.d")
+        cache = ShardedLogAPICache(cache_dir, num_shards=1)
+        cache["good"] = "value"
+        cache.close()
+
+        with open(os.path.join(cache_dir, "shard-000.log"), "ab") as f:
+            f.write(b"\x05\x00\x00\x00\xff\x00")
+
+        cache = ShardedLogAPICache(cache_dir)
+        assert len(cache) == 1
+        assert cache["good"] == "value"
+        cache["another"] = "value 2"
+        cache.close()
+
+        assert ShardedLogAPICache(cache_dir)["another"] == "value 2"
+
+    def test_shared_by_several_instances(self, temp_cache_dir):
+        """Test that instances open at the same time (e.g., in several processes) see each other's entries."""
+        cache_dir = os.path.join(temp_cache_dir, "cache.d")
+        cache1 = ShardedLogAPICache(cache_dir, num_shards=2)
+        cache2 = ShardedLogAPICache(cache_dir)
+
+        cache1["a"] = "from 1"
+        cache2["b"] = "from 2"
+        assert cache2["a"] == "from 1"
+        assert "b" in cache1
+        assert len(cache1) == len(cache2) == 2
+
+        # an instance can compact shards while another keeps using them
+        for i in range(10):
+            cache1["a"] = f"from 1, version {i}"
+        cache1.compact()
+        cache2["c"] = "from 2, after compaction"
+
+        assert cache2["a"] == "from 1, version 9"
+        assert cache1["c"] == "from 2, after compaction"
+        assert cache1["b"] == "from 2"
+        cache1.close()
+        cache2.close()
+
+        assert len(ShardedLogAPICache(cache_dir)) == 3
+
+    @pytest.mark.core
+    def test_migration_from_pickle(self, temp_cache_dir):
+        """Test that an existing pickle cache is migrated when the sharded log backend is first used."""
+        pickle_file = os.path.join(temp_cache_dir, "openai_api_cache.pickle")
+        with open(pickle_file, "wb") as f:
+            pickle.dump({"old_key": {"cached": "response"}}, f)
+
+        cache = create_api_cache(pickle_file, CACHE_BACKEND_SHARDED_LOG)
+
+        assert isinstance(cache, ShardedLogAPICache)
+        assert cache.directory == os.path.join(temp_cache_dir, "openai_api_cache.cache.d")
+        assert cache["old_key"] == {"cached": "response"}
+        cache.close()
+
+    def test_client_uses_sharded_log_backend(self, temp_cache_dir):
+        """Test that OpenAIClient stores entries through the configured backend."""
+        cache_file = os.path.join(temp_cache_dir, "api_cache.pickle")
+        client = OpenAIClient(cache_api_calls=True, cache_file_name=cache_file)
+        client.set_api_cache(True, cache_file, cache_backend=CACHE_BACKEND_SHARDED_LOG)
+
+        client.api_cache["test_key"] = {"response": "test_value"}
+        client._save_cache()
+
+        assert not os.path.exists(cache_file), "No pickle file should be written by the sharded log backend"
+
+        client2 = OpenAIClient(cache_api_calls=False, cache_file_name=cache_file)
+        client2.set_api_cache(True, cache_file, cache_backend=CACHE_BACKEND_SHARDED_LOG)
+        assert client2.api_cache["test_key"] == {"response": "test_value"}
+
+        client.api_cache.close()
+        client2.api_cache.close()
+
+    def test_unknown_backend_raises(self, temp_cache_dir):
+        """Test that an unknown backend name is rejected."""
+        with pytest.raises(ValueError):
+            create_api_cache(os.path.join(temp_cache_dir, "cache.pickle"), "no_such_backend")
+
+
+class TestRequestCacheKeys:
+    """Tests for the digest-based cache keys and the cache entry format."""
+
+    @pytest.fixture
+    def temp_cache_file(self):
+        """Creates a temporary file path for cache testing (file is not created)."""
+        with tempfile.TemporaryDirectory() as path:
+            yield os.path.join(path, "api_cache.pickle")
+
+    @staticmethod
+    def _chat_api_params(content="Hello!", **kwargs):
+        params = {
+            "model": "gpt-4o-mini",
+            "messages": [{"role": "user", "content": content}],
+            "temperature": 1.0,
+            "stream": False,
+            "n": 1,
+        }
+        params.update(kwargs)
+        return params
+
+    @staticmethod
+    def _completion_dict(content="Hi there!"):
+        return {
+            "id": "chatcmpl-test",
+            "object": "chat.completion",
+            "created": 0,
+            "model": "gpt-4o-mini",
+            "choices": [{"index": 0, "finish_reason": "stop",
+                         "message": {"role": "assistant", "content": content}}],
+        }
+
+    @pytest.mark.core
+    def test_key_is_stable_digest(self):
+        """Test that equivalent requests map to the same fixed-size key, and different ones do not."""
+        key1, request_json = request_cache_key("gpt-4o-mini", self._chat_api_params())
+        key2, _ = request_cache_key("gpt-4o-mini", dict(reversed(list(self._chat_api_params().items()))))
+        key3, _ = request_cache_key("gpt-4o-mini", self._chat_api_params(content="Bye!"))
+
+        assert key1 == key2
+        assert key1 != key3
+        assert len(key1) == 64
+        assert "Hello!" in request_json
+
+    def test_key_ignores_timeout(self):
+        """Test that parameters which do not affect the response are not part of the key."""
+        key1, _ = request_cache_key("gpt-4o-mini", self._chat_api_params(timeout=10))
+        key2, _ = request_cache_key("gpt-4o-mini", self._chat_api_params(timeout=60))
+        assert key1 == key2
+
+    def test_key_supports_response_format_classes(self):
+        """Test that Pydantic classes used as response formats are part of the key."""
+        from pydantic import BaseModel
+
+        class FormatA(BaseModel):
+            a: str
+
+        class FormatB(BaseModel):
+            b: int
+
+        key_a, _ = request_cache_key("gpt-4o-mini", self._chat_api_params(response_format=FormatA))
+        key_b, _ = request_cache_key("gpt-4o-mini", self._chat_api_params(response_format=FormatB))
+        assert key_a != key_b
+
+    @pytest.mark.core
+    def test_cache_entry_roundtrip(self):
+        """Test that cache entries keep both request and response, compressed or not."""
+        response = self._completion_dict("x" * 10000)
+        for compress in [True, False]:
+            entry = make_cache_entry('{"model":"m"}', response, compress=compress)
+            request_json, unpacked_response = unpack_cache_entry(pickle.loads(pickle.dumps(entry)))
+            assert request_json == '{"model":"m"}'
+            assert unpacked_response == response
+
+        compressed = pickle.dumps(make_cache_entry('{"model":"m"}', response, compress=True))
+        assert len(compressed) < len(pickle.dumps(response))
+
+    def test_unpack_legacy_value(self):
+        """Test that bare responses, as stored by previous versions, are unpacked as they are."""
+        assert unpack_cache_entry({"cached": "response"}) == (None, {"cached": "response"})
+
+    @pytest.mark.core
+    def test_client_reads_legacy_keys(self, temp_cache_file):
+        """Test that a cache keyed by the string representation of requests is still used, rekeyed once when loaded."""
+        chat_api_params = self._chat_api_params()
+        with open(temp_cache_file, "wb") as f:
+            pickle.dump({legacy_request_cache_key("gpt-4o-mini", chat_api_params): self._completion_dict()}, f)
+
+        client = OpenAIClient(cache_api_calls=True, cache_file_name=temp_cache_file)
+        key, request_json = request_cache_key("gpt-4o-mini", chat_api_params)
+        legacy_key = legacy_request_cache_key("gpt-4o-mini", chat_api_params)
+
+        # the legacy entry was moved to its new key, also on disk
+        assert key in client.api_cache
+        assert legacy_key not in client.api_cache
+        assert unpack_cache_entry(client.api_cache[key])[0] == request_json
+        assert list(PickleAPICache(temp_cache_file).keys()) == [key]
+
+        # lookups do not write to the cache
+        with patch.object(PickleAPICache, "flush") as flush:
+            response = client._get_cached_response(key, request_json, legacy_key)
+        flush.assert_not_called()
+
+        assert response is not None
+        assert response.choices[0].message.content == "Hi there!"
+
+    def test_rekey_legacy_entries(self, temp_cache_file):
+        """Test that legacy entries can be rekeyed in bulk."""
+        chat_api_params = self._chat_api_params()
+        with open(temp_cache_file, "wb") as f:
+            pickle.dump({legacy_request_cache_key("gpt-4o-mini", chat_api_params): self._completion_dict(),
+                         "not a legacy key": {}}, f)
+
+        cache = PickleAPICache(temp_cache_file)
+        assert rekey_legacy_entries(cache) == 1
+
+        key, _ = request_cache_key("gpt-4o-mini", chat_api_params)
+        assert unpack_cache_entry(PickleAPICache(temp_cache_file)[key])[1] == self._completion_dict()
+        assert sorted(PickleAPICache(temp_cache_file).keys()) == sorted([key, "not a legacy key"])
@@ -0,0 +1,107 @@
+"""
+Tests for the asynchronous model call path (`async_send_message`, `TinyPerson.act_async` and `TinyWorld.run_async`).
+
+These tests run against a local fake OpenAI server, so they do not need access to a real LLM API.
+"""
+import asyncio
+import json
+import sys
+
+import pytest
+
+# Insert paths at the beginning of sys.path (position 0)
+sys.path.insert(0, "..")
+sys.path.insert(0, "../../")
+sys.path.insert(0, "../../tinytroupe/")
+
+from testing_utils import *
+
+from tinytroupe.agent import TinyPerson
+from tinytroupe.agent.action_generator import ActionGenerator
+from tinytroupe.clients.openai_client import OpenAIClient
+from tinytroupe.environment import TinyWorld
+
+
+def _actions_response(request):
+    return json.dumps({
+        "actions": [
+            {"type": "TALK", "content": "Hello there, everyone!", "target": ""},
+            {"type": "DONE", "content": "", "target": ""},
+        ],
+        "cognitive_state": {"goals": "Greet people.", "context": ["A meeting."], "attention": "People.", "emotions": "Happy."},
+    })
+
+
+def _create_agent(name):
+    agent = TinyPerson(name, action_generator=ActionGenerator(enable_quality_checks=False))
+    agent.define("occupation", "Tester")
+    return agent
+
+
+@pytest.mark.core
+def test_async_send_message(fake_openai_server):
+    client = OpenAIClient(cache_api_calls=False)
+
+    message = asyncio.run(client.async_send_message([{"role": "user", "content": "Hi!"}], model="gpt-4o-mini"))
+
+    assert message["content"] == "Hello from the fake server!"
+    assert len(fake_openai_server.requests) == 1
+    assert fake_openai_server.requests[0]["messages"][0]["content"] == "Hi!"
+    assert client.get_cost_stats()["model_calls"] == 1
+    assert client.get_cost_stats()["total_tokens"] == 15
+
+
+def test_async_send_message_uses_cache(fake_openai_server, tmp_path):
+    client = OpenAIClient(cache_api_calls=True, cache_file_name=str(tmp_path / "api_cache.pickle"))
+
+    async def aux_send_twice():
+        first = await client.async_send_message([{"role": "user", "content": "Hi!"}], model="gpt-4o-mini")
+        second = await client.async_send_message([{"role": "user", "content": "Hi!"}], model="gpt-4o-mini")
+        return first, second
+
+    first, second = asyncio.run(aux_send_twice())
+
+    assert first["content"] == second["content"]
+    assert len(fake_openai_server.requests) == 1
+    assert client.get_cost_stats()["cached_calls"] == 1
+
+
+def test_async_send_message_limits_concurrency(fake_openai_server):
+    fake_openai_server.delay = 0.1
+    client = OpenAIClient(cache_api_calls=False, max_concurrent_async_model_calls=5)
+
+    async def aux_send_many():
+        return await asyncio.gather(*[
+            client.async_send_message([{"role": "user", "content": f"Request {i}"}], model="gpt-4o-mini")
+            for i in range(20)
+        ])
+
+    messages = asyncio.run(aux_send_many())
+
+    assert len(messages) == 20
+    assert all(m["content"] == "Hello from the fake server!" for m in messages)
+    assert 1 < fake_openai_server.max_in_flight <= 5
+
+
+@pytest.mark.core
+def test_act_async(fake_openai_server):
+    fake_openai_server.responder = _actions_response
+    agent = _create_agent("Alice Async")
+    agent.listen("Hello, how are you?")
+
+    actions = asyncio.run(agent.act_async(return_actions=True))
+
+    assert [a["action"]["type"] for a in actions] == ["TALK", "DONE"]
+    assert agent.pop_latest_actions()[0]["content"] == "Hello there, everyone!"
+
+
+def test_run_async(fake_openai_server):
+    fake_openai_server.responder = _actions_response
+    world = TinyWorld("Async land", [_create_agent("Bob Async"), _create_agent("Carol Async")])
+    world.broadcast("Please introduce yourselves.")
+
+    actions_over_time = asyncio.run(world.run_async(2, return_actions=True))
+
+    assert len(actions_over_time) == 2
+    for agents_actions in actions_over_time:
+        assert set(agents_actions.keys()) == {"Bob Async", "Carol Async"}
@@ -1,5 +1,6 @@
 import pytest
 import os
+import json
 
 import sys
 # Insert paths at the beginning of sys.path (position 0)
@@ -11,7 +12,8 @@ sys.path.insert(0, '../../tinytroupe/')
 from tinytroupe.examples import create_oscar_the_architect, create_lisa_the_data_scientist
 from tinytroupe.agent import TinyPerson, TinyToolUse
 from tinytroupe.environment import TinyWorld
-from tinytroupe.control import Simulation
+from tinytroupe import config_manager
+from tinytroupe.control import Simulation, CachedTrace
 import tinytroupe.control as control
 from tinytroupe.factory import TinyPersonFactory
 from tinytroupe.enrichment import TinyEnricher
@@ -172,10 +174,10 @@ def test_begin_checkpoint_end_with_factory(setup):
     with open("control_test_personfactory.cache.json", "r") as f:
         cache_contents = f.read()
 
-    assert "'_aux_model_call'" in cache_contents, "The cache file should contain the '_aux_model_call' call."
-    assert "'_setup_agent'" in cache_contents, "The cache file should contain the '_setup_agent' call."
-    assert "'define'" not in cache_contents, "The cache file should not contain the 'define' methods, as these are reentrant."
-    assert "'define_several'" not in cache_contents, "The cache file should not contain the 'define_several' methods, as these are reentrant."
+    assert '"_aux_model_call:' in cache_contents, "The cache file should contain the '_aux_model_call' call."
+    assert '"_setup_agent:' in cache_contents, "The cache file should contain the '_setup_agent' call."
+    assert '"define:' not in cache_contents, "The cache file should not contain the 'define' methods, as these are reentrant."
+    assert '"define_several:' not in cache_contents, "The cache file should not contain the 'define_several' methods, as these are reentrant."
 
 
 def test_begin_checkpoint_end_with_factory_multiple_people(setup):
@@ -250,10 +252,10 @@ def test_begin_checkpoint_end_with_factory_multiple_people(setup):
     with open("control_test_personfactory_multiple.cache.json", "r") as f:
         cache_contents = f.read()
 
-    assert "'_aux_model_call'" in cache_contents, "The cache file should contain the '_aux_model_call' call."
-    assert "'_setup_agent'" in cache_contents, "The cache file should contain the '_setup_agent' call."
-    assert "'define'" not in cache_contents, "The cache file should not contain the 'define' methods, as these are reentrant."
-    assert "'define_several'" not in cache_contents, "The cache file should not contain the 'define_several' methods, as these are reentrant."
+    assert '"_aux_model_call:' in cache_contents, "The cache file should contain the '_aux_model_call' call."
+    assert '"_setup_agent:' in cache_contents, "The cache file should contain the '_setup_agent' call."
+    assert '"define:' not in cache_contents, "The cache file should not contain the 'define' methods, as these are reentrant."
+    assert '"define_several:' not in cache_contents, "The cache file should not contain the 'define_several' methods, as these are reentrant."
 
 
 def test_begin_checkpoint_end_with_factory_demography(setup):
@@ -349,11 +351,504 @@ def test_begin_checkpoint_end_with_factory_demography(setup):
     with open("control_test_personfactory_demography.cache.json", "r") as f:
         cache_contents = f.read()
 
-    assert "'_aux_model_call'" in cache_contents, "The cache file should contain the '_aux_model_call' call."
-    assert "'_setup_agent'" in cache_contents, "The cache file should contain the '_setup_agent' call."
+    assert '"_aux_model_call:' in cache_contents, "The cache file should contain the '_aux_model_call' call."
+    assert '"_setup_agent:' in cache_contents, "The cache file should contain the '_setup_agent' call."
     # Note: _compute_sampling_dimensions and _compute_sample_plan are reentrant calls within _initialize_sampling_plan_transaction,
     # so they don't create separate cache entries. The parent transaction caches their results properly.
-    assert "'define'" not in cache_contents, "The cache file should not contain the 'define' methods, as these are reentrant."
-    assert "'define_several'" not in cache_contents, "The cache file should not contain the 'define_several' methods, as these are reentrant."
+    assert '"define:' not in cache_contents, "The cache file should not contain the 'define' methods, as these are reentrant."
+    assert '"define_several:' not in cache_contents, "The cache file should not contain the 'define_several' methods, as these are reentrant."
 
 
+def _trace_node(event, state):
+    return [None, event, None, {"agents": [state]}]
+
+def test_cached_trace_checkpoints_only_append(tmp_path):
+    cache_path = str(tmp_path / "trace.cache.json")
+
+    trace = CachedTrace()
+    trace.append(_trace_node("('act', [], {})", "first"))
+    trace.append(_trace_node("('listen', [], {})", "second"))
+    trace.save(cache_path)
+
+    with open(cache_path, "rb") as f:
+        first_checkpoint = f.read()
+
+    trace.append(_trace_node("('act', [], {})", "third"))
+    trace.save(cache_path)
+
+    with open(cache_path, "rb") as f:
+        second_checkpoint = f.read()
+
+    # the second checkpoint only appended the new node
+    assert second_checkpoint.startswith(first_checkpoint)
+    assert second_checkpoint.count(b"\n") == first_checkpoint.count(b"\n") + 1
+
+    # events are readable even though nodes are compressed
+    assert "('listen', [], {})" in second_checkpoint.decode("utf-8")
+
+    loaded = CachedTrace.load(cache_path)
+    assert len(loaded) == 3
+    assert loaded[2] == _trace_node("('act', [], {})", "third")
+    assert [node[3]["agents"][0] for node in loaded] == ["first", "second", "third"]
+
+def test_cached_trace_truncation_and_parallel_segments(tmp_path):
+    cache_path = str(tmp_path / "trace.cache.json")
+
+    trace = CachedTrace([_trace_node("a", "first"), _trace_node("b", "second")])
+    trace.append({})
+    trace.save(cache_path, compress=False)
+
+    # parallel segments are filled in place after being added
+    trace[-1]["c"] = {"prev_node_hash": None, "encoded_output": 1}
+    trace.mark_changed(-1)
+    trace.save(cache_path, compress=False)
+
+    # execution diverged from the cache after the first node
+    trace.truncate(1)
+    trace.append(_trace_node("d", "fourth"))
+    trace.save(cache_path, compress=False)
+
+    loaded = CachedTrace.load(cache_path)
+    assert list(loaded) == [_trace_node("a", "first"), _trace_node("d", "fourth")]
+
+    loaded.truncate(1)
+    loaded.append({"e": {"prev_node_hash": None, "encoded_output": 2}})
+    loaded.save(cache_path)
+    assert list(CachedTrace.load(cache_path)) == [_trace_node("a", "first"), {"e": {"prev_node_hash": None, "encoded_output": 2}}]
+
+def test_cached_trace_ignores_incomplete_records(tmp_path):
+    cache_path = str(tmp_path / "trace.cache.json")
+
+    trace = CachedTrace([_trace_node("a", "first"), _trace_node("b", "second")])
+    trace.save(cache_path)
+
+    # e.g., the process was killed while checkpointing
+    with open(cache_path, "ab") as f:
+        f.write(b"Z 2 {\"events\": [\"c\"], \"zli")
+
+    loaded = CachedTrace.load(cache_path)
+    assert len(loaded) == 2
+
+    loaded.append(_trace_node("c", "third"))
+    loaded.save(cache_path)
+    assert [node[1] for node in CachedTrace.load(cache_path)] == ["a", "b", "c"]
+
+def test_cached_trace_loads_older_json_files(tmp_path):
+    cache_path = str(tmp_path / "trace.cache.json")
+    with open(cache_path, "w", encoding="utf-8") as f:
+        json.dump([_trace_node("a", "first"), {"b": {"prev_node_hash": None, "encoded_output": None}}], f, indent=4)
+
+    loaded = CachedTrace.load(cache_path)
+    assert len(loaded) == 2
+    assert loaded[0] == _trace_node("a", "first")
+
+    # saving converts the file to the new format
+    loaded.save(cache_path)
+    with open(cache_path, "rb") as f:
+        assert f.readline() == CachedTrace.HEADER
+    assert list(CachedTrace.load(cache_path)) == list(loaded)
+
+
+def test_simulation_states_are_stored_as_deltas(setup, tmp_path):
+    cache_path = str(tmp_path / "delta_test.cache.json")
+
+    original_interval = config_manager.get("state_snapshot_interval")
+    config_manager.update("state_snapshot_interval", 3)
+    try:
+        control.reset()
+        control.begin(cache_path)
+        simulation = control._current_simulations["default"]
+
+        agent = TinyPerson("Delta Tester")
+        for age in range(20, 27):
+            agent.define("age", age)
+
+        # one full snapshot every 3 nodes, deltas against the previous node in between
+        states = [node[3] for node in simulation.cached_trace]
+        snapshots = [i for i, state in enumerate(states) if "delta_of" not in state]
+        assert snapshots == list(range(0, len(states), 3))
+        assert all(states[i]["delta_of"] == i - 1 for i in range(len(states)) if i not in snapshots)
+
+        # the latest state is reconstructed from the nearest snapshot
+        expected_state = simulation._encode_simulation_state(refresh=True)
+        simulation._last_state = None
+        assert simulation._cached_state_at(len(states) - 1) == expected_state
+
+        control.end()
+
+        # replaying the simulation restores the states from the cache
+        control.reset()
+        control.begin(cache_path)
+        agent = TinyPerson("Delta Tester")
+        for age in range(20, 27):
+            agent.define("age", age)
+
+        simulation = control._current_simulations["default"]
+        assert simulation.cache_hits == len(states)
+        assert agent.get("age") == 26
+        control.end()
+    finally:
+        config_manager.update("state_snapshot_interval", original_interval)
+        control.reset()
+
+def test_changes_outside_transactions_are_encoded(setup, tmp_path):
+    from tinytroupe.agent.mental_faculty import RecallFaculty
+
+    cache_path = str(tmp_path / "outside_transactions_test.cache.json")
+
+    try:
+        control.reset()
+        control.begin(cache_path)
+        simulation = control._current_simulations["default"]
+
+        changed, other = TinyPerson("Changed Outside"), TinyPerson("Other")
+        changed.define("age", 30)
+
+        # no transaction involves the agent, but its state changes
+        changed.add_mental_faculty(RecallFaculty())
+        changed._displayed_communications_buffer.append({"content": "Hello"})
+        other.define("age", 40)
+
+        assert simulation._cached_state_at(len(simulation.cached_trace) - 1) == \
+               simulation._encode_simulation_state(refresh=True)
+        control.end()
+    finally:
+        control.reset()
+
+def test_long_delta_chains_are_reconstructed_iteratively(setup, tmp_path):
+    import inspect
+
+    cache_path = str(tmp_path / "long_delta_chain_test.cache.json")
+
+    original_interval = config_manager.get("state_snapshot_interval")
+    config_manager.update("state_snapshot_interval", 1000)
+    try:
+        control.reset()
+        control.begin(cache_path)
+        simulation = control._current_simulations["default"]
+
+        agent = TinyPerson("Long Chain Tester")
+        for age in range(300):
+            agent.define("age", age)
+
+        expected_state = simulation._encode_simulation_state(refresh=True)
+
+        # a cold lookup must not recurse once per delta
+        simulation._last_state = None
+        original_recursion_limit = sys.getrecursionlimit()
+        sys.setrecursionlimit(len(inspect.stack(0)) + 100)
+        try:
+            state = simulation._cached_state_at(len(simulation.cached_trace) - 1)
+        finally:
+            sys.setrecursionlimit(original_recursion_limit)
+
+        assert state == expected_state
+        control.end()
+    finally:
+        config_manager.update("state_snapshot_interval", original_interval)
+        control.reset()
+
+def test_fast_forward_replay_restores_state_once(setup, tmp_path):
+    cache_path = str(tmp_path / "fast_forward_test.cache.json")
+
+    def aux_run_simulation(ages, fast_forward):
+        control.reset()
+        control.begin(cache_path, fast_forward=fast_forward)
+        simulation = control._current_simulations["default"]
+
+        decoded_states = []
+        original_decode = simulation._decode_simulation_state
+        def aux_decode(state):
+            decoded_states.append(state)
+            original_decode(state)
+        simulation._decode_simulation_state = aux_decode
+
+        agent = TinyPerson("Fast Forward Tester")
+        for age in ages:
+            agent.define("age", age)
+
+        control.end()
+        return simulation, agent, decoded_states
+
+    try:
+        aux_run_simulation(range(20, 30), fast_forward=False)
+
+        # a complete replay restores the state only once, at the end
+        simulation, agent, decoded_states = aux_run_simulation(range(20, 30), fast_forward=True)
+        assert simulation.cache_hits == len(simulation.cached_trace)
+        assert len(decoded_states) == 1
+        assert agent.get("age") == 29
+
+        # the state reached by the replay is restored before the first cache miss
+        simulation, agent, decoded_states = aux_run_simulation(list(range(20, 25)) + [50, 51], fast_forward=True)
+        assert simulation.cache_misses == 2
+        assert len(decoded_states) == 1
+        assert agent.get("age") == 51
+
+        # without fast-forwarding, every cached step restores its state
+        simulation, agent, decoded_states = aux_run_simulation(list(range(20, 25)) + [50, 51], fast_forward=False)
+        assert len(decoded_states) == simulation.cache_hits
+    finally:
+        control.reset()
+
+def test_fast_forward_state_restored_before_parallel_segment(setup, tmp_path):
+    cache_path = str(tmp_path / "fast_forward_parallel_test.cache.json")
+
+    def aux_run_simulation():
+        control.reset()
+        control.begin(cache_path, fast_forward=True)
+        simulation = control._current_simulations["default"]
+
+        agent = TinyPerson("Parallel Fast Forward Tester")
+        for age in range(20, 25):
+            agent.define("age", age)
+
+        return simulation, agent
+
+    try:
+        simulation, agent = aux_run_simulation()
+        control.end()
+
+        # the replay only defers the state restoration...
+        simulation, agent = aux_run_simulation()
+        assert simulation._pending_state_position is not None
+
+        # ...which must happen before the parallel segment begins, not within it
+        observed = []
+        def aux_parallel_step():
+            observed.append((simulation.is_under_parallel_transactions(),
+                             simulation._pending_state_position, agent.get("age")))
+            return True
+
+        control.Transaction(agent, simulation, aux_parallel_step).execute(begin_parallel=True)
+        assert observed == [(True, None, 24)]
+        control.end()
+    finally:
+        control.reset()
+
+def test_failed_transaction_does_not_leave_thread_under_transaction(setup, tmp_path):
+    from concurrent.futures import ThreadPoolExecutor
+
+    cache_path = str(tmp_path / "failed_transaction_test.cache.json")
+
+    @control.transactional()
+    def aux_failing_step(agent):
+        raise RuntimeError("Something went wrong.")
+
+    @control.transactional()
+    def aux_step(agent, age):
+        agent.define("age", age)
+
+    try:
+        control.reset()
+        control.begin(cache_path)
+        simulation = control._current_simulations["default"]
+        agent = TinyPerson("Failing Tester")
+
+        # threads are reused, as in the shared thread pool
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            with pytest.raises(RuntimeError):
+                executor.submit(aux_failing_step, agent).result()
+
+            cached_nodes = len(simulation.cached_trace)
+            executor.submit(aux_step, agent, 30).result()
+
+        # the later transaction on the same thread is not taken as reentrant, so it is cached
+        assert len(simulation.cached_trace) == cached_nodes + 1
+        assert not any(simulation._under_transaction.values())
+        control.end()
+    finally:
+        control.reset()
+
+def test_function_call_fingerprints(setup):
+    simulation = Simulation()
+    agent = TinyPerson("Fingerprint Tester")
+
+    def aux_function():
+        pass
+
+    fingerprint = simulation._function_call_hash("act", agent, {"b": 1, "a": [1, 2]}, callback=aux_function)
+
+    assert fingerprint.startswith("act:")
+    assert Simulation._is_event_fingerprint(fingerprint)
+    assert len(fingerprint) == len("act:") + 2 * Simulation.EVENT_FINGERPRINT_DIGEST_SIZE
+
+    # dictionary ordering and memory addresses do not matter, but values and their types do
+    assert fingerprint == simulation._function_call_hash("act", agent, {"a": [1, 2], "b": 1}, callback=aux_function)
+    assert fingerprint != simulation._function_call_hash("act", agent, {"a": [1, 2], "b": "1"}, callback=aux_function)
+    assert fingerprint != simulation._function_call_hash("act", TinyPerson("Another Tester"), {"a": [1, 2], "b": 1}, callback=aux_function)
+
+    # the size of the fingerprint does not depend on the size of the arguments
+    assert len(simulation._function_call_hash("listen", agent, "Hello! " * 10000)) == len(simulation._function_call_hash("listen", agent, ""))
+
+def test_legacy_cached_events_are_migrated(setup, tmp_path):
+    cache_path = str(tmp_path / "legacy_test.cache.json")
+    ages = range(20, 25)
+
+    control.reset()
+    control.begin(cache_path)
+    agent = TinyPerson("Legacy Tester")
+    for age in ages:
+        agent.define("age", age)
+    control.end()
+
+    # rewrite the cache file as older versions did, identifying events by their string representation
+    simulation = control._current_simulations["default"]
+    legacy_trace = []
+    for node, age in zip(simulation.cached_trace, ages):
+        legacy_trace.append([node[0], simulation._legacy_function_call_hash("define", agent, "age", age), node[2], node[3]])
+
+    assert not any(Simulation._is_event_fingerprint(node[1]) for node in legacy_trace)
+    with open(cache_path, "w", encoding="utf-8") as f:
+        json.dump(legacy_trace, f)
+
+    control.reset()
+    control.begin(cache_path)
+    agent = TinyPerson("Legacy Tester")
+    for age in ages:
+        agent.define("age", age)
+    control.end()
+
+    simulation = control._current_simulations["default"]
+    assert simulation.cache_misses == 0
+
+    # the cache file now has the fingerprints of the events replayed
+    migrated_events = [node[1] for node in CachedTrace.load(cache_path)]
+    assert len(migrated_events) == len(ages)
+    assert all(event.startswith("define:") and Simulation._is_event_fingerprint(event) for event in migrated_events)
+    control.reset()
+
+def test_cached_trace_chain_digests(tmp_path):
+    cache_path = str(tmp_path / "trace.cache.json")
+
+    trace = CachedTrace([_trace_node("a", "first"), _trace_node("b", "second"), {"c": {"prev_node_hash": None, "encoded_output": 1}}])
+    other_trace = CachedTrace([_trace_node("a", "first"), [None, "b", "other output", None], {"c": {"prev_node_hash": None, "encoded_output": 1}}])
+
+    # digests cover events and outputs, but not states, and chain all previous nodes
+    assert trace.digest(0) == other_trace.digest(0) == CachedTrace.chain_digest(None, [None, "a", None, "another state"])
+    assert trace.digest(1) != other_trace.digest(1)
+    assert trace.digest(2) != other_trace.digest(2)
+    assert trace.position_of(other_trace.digest(0)) == 0
+    assert trace.position_of(other_trace.digest(2)) is None
+    assert trace.position_of(trace.digest(-1)) == 2
+
+    # digests are stored in the file, and survive further changes
+    trace.save(cache_path)
+    loaded = CachedTrace.load(cache_path)
+    assert [loaded.digest(i) for i in range(3)] == [trace.digest(i) for i in range(3)]
+
+    loaded.truncate(1)
+    assert loaded.position_of(trace.digest(1)) is None
+    loaded.append(_trace_node("b", "second"))
+    assert loaded.digest(1) == trace.digest(1)
+
+    loaded[0] = _trace_node("z", "first")
+    assert loaded.digest(1) != trace.digest(1)
+    loaded.save(cache_path)
+    assert CachedTrace.load(cache_path).digest(1) == loaded.digest(1)
+
+def test_cached_trace_loads_files_without_digests(tmp_path):
+    cache_path = str(tmp_path / "trace.cache.json")
+    with open(cache_path, "wb") as f:
+        f.write(CachedTrace.HEADER_V1)
+        f.write(f"N 0 {json.dumps(_trace_node('a', 'first'))}\n".encode("utf-8"))
+        f.write(f"N 1 {json.dumps(_trace_node('b', 'second'))}\n".encode("utf-8"))
+
+    loaded = CachedTrace.load(cache_path)
+    assert list(loaded) == [_trace_node("a", "first"), _trace_node("b", "second")]
+
+    loaded.save(cache_path)
+    with open(cache_path, "rb") as f:
+        assert f.readline() == CachedTrace.HEADER
+    assert CachedTrace.load(cache_path).digest(1) == loaded.digest(1)
+
+def test_cached_events_are_only_reused_after_the_same_history():
+    cached_trace = [_trace_node("a", "first"), _trace_node("b", "second")]
+
+    simulation = Simulation(cached_trace=cached_trace)
+    simulation.execution_trace = [_trace_node("a", "first")]
+    assert simulation._is_transaction_event_cached("b")
+
+    # the same event, after a different output, cannot reuse the cached result
+    simulation = Simulation(cached_trace=cached_trace)
+    simulation.execution_trace = [[None, "a", "different output", None]]
+    assert not simulation._is_transaction_event_cached("b")
+
+def test_cached_trace_forks_share_nodes(tmp_path):
+    base_path = str(tmp_path / "base.cache.json")
+    fork_path = str(tmp_path / "arms" / "fork.cache.json")
+    os.makedirs(tmp_path / "arms")
+
+    base = CachedTrace([_trace_node(event, state) for event, state in [("a", "first"), ("b", "second"), ("c", "third")]])
+    base.name_node("setup", 1)
+    base.save(base_path)
+    with open(base_path, "rb") as f:
+        base_contents = f.read()
+
+    fork = CachedTrace.fork(CachedTrace.load(base_path), base.named_node_position("setup") + 1)
+    fork.append(_trace_node("d", "fourth"))
+    assert list(fork) == [_trace_node("a", "first"), _trace_node("b", "second"), _trace_node("d", "fourth")]
+    assert fork.digest(1) == base.digest(1)
+
+    fork.save(fork_path)
+    with open(fork_path, "rb") as f:
+        fork_contents = f.read()
+
+    # the fork's file only has the header, the reference to the base file, its own node and the inherited name
+    assert fork_contents.count(b"\n") == 4
+    assert fork_contents.split(b"\n")[1].startswith(b"B 2 ")
+
+    # the base file is left untouched
+    with open(base_path, "rb") as f:
+        assert f.read() == base_contents
+
+    loaded = CachedTrace.load(fork_path)
+    assert list(loaded) == list(fork)
+    assert loaded.digest(2) == fork.digest(2)
+    assert loaded.named_node_position("setup") == 1
+
+    # changing a shared node only changes the fork
+    loaded[1] = _trace_node("z", "changed")
+    loaded.name_node("changed", 1)
+    loaded.save(fork_path)
+    assert [node[1] for node in CachedTrace.load(fork_path)] == ["a", "z", "d"]
+    assert CachedTrace.load(fork_path).named_node_position("changed") == 1
+    assert [node[1] for node in CachedTrace.load(base_path)] == ["a", "b", "c"]
+
+def test_simulation_forked_from_named_checkpoint(setup, tmp_path):
+    base_path = str(tmp_path / "base.cache.json")
+    arm_path = str(tmp_path / "arm.cache.json")
+
+    control.reset()
+    control.begin(base_path)
+    agent = TinyPerson("Fork Tester")
+    for age in range(20, 23):
+        agent.define("age", age)
+    control.checkpoint(name="warm-up")
+    agent.define("age", 30)
+    control.end()
+    base_size = os.path.getsize(base_path)
+
+    for _ in range(2):
+        control.reset()
+        control.begin(arm_path, fork_from=base_path, fork_at="warm-up")
+        agent = TinyPerson("Fork Tester")
+        for age in range(20, 23):
+            agent.define("age", age)
+        agent.define("age", 40)
+        control.end()
+
+    # the second run of the arm replays it completely, including the shared warm-up
+    simulation = control._current_simulations["default"]
+    assert simulation.cache_hits == 4 and simulation.cache_misses == 0
+    assert agent.get("age") == 40
+
+    assert os.path.getsize(base_path) == base_size
+    assert len(CachedTrace.load(base_path)) == 4
+    assert len(CachedTrace.load(arm_path)) == 4
+    assert os.path.getsize(arm_path) < base_size
+
+    control.reset()
+    with pytest.raises(ValueError):
+        control.begin(str(tmp_path / "other_arm.cache.json"), fork_from=base_path, fork_at="no such checkpoint")
+    control.reset()
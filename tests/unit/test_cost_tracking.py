@@ -35,18 +35,22 @@ def test_openai_client_get_cost_stats_structure(setup):
 
     assert isinstance(stats, dict), "get_cost_stats should return a dict"
     assert "input_tokens" in stats, "Missing input_tokens in stats"
+    assert "cached_input_tokens" in stats, "Missing cached_input_tokens in stats"
     assert "output_tokens" in stats, "Missing output_tokens in stats"
     assert "total_tokens" in stats, "Missing total_tokens in stats"
     assert "model_calls" in stats, "Missing model_calls in stats"
     assert "cached_calls" in stats, "Missing cached_calls in stats"
+    assert "coalesced_calls" in stats, "Missing coalesced_calls in stats"
 
     # All values should be non-negative integers
     for key in [
         "input_tokens",
+        "cached_input_tokens",
         "output_tokens",
         "total_tokens",
         "model_calls",
         "cached_calls",
+        "coalesced_calls",
     ]:
         assert isinstance(stats[key], int), f"{key} should be an integer"
         assert stats[key] >= 0, f"{key} should be non-negative"
@@ -67,6 +71,19 @@ def test_openai_client_reset_cost_stats(setup):
     assert stats["cached_calls"] == 0, "cached_calls should be 0 after reset"
 
 
+def test_openai_client_counts_cached_input_tokens(fake_openai_server):
+    """Test that the input tokens served from the provider's prompt cache are counted."""
+    from tinytroupe.clients.openai_client import OpenAIClient
+
+    cli = OpenAIClient(cache_api_calls=False)
+    cli.send_message([{"role": "user", "content": "Hi!"}], model="gpt-4o-mini")
+    cli.send_message([{"role": "user", "content": "Hi again!"}], model="gpt-4o-mini")
+
+    stats = cli.get_cost_stats()
+    assert stats["input_tokens"] == 20, "input_tokens should count all prompt tokens"
+    assert stats["cached_input_tokens"] == 8, "cached_input_tokens should count the cached prompt tokens"
+
+
 def test_tinyworld_cost_tracking_methods_exist(setup):
     """Test that TinyWorld has all cost tracking methods."""
     world = TinyWorld("TestWorld")
@@ -0,0 +1,133 @@
+"""
+Tests for the persistent embedding cache, the batched embedding API of the clients, and the cached
+LlamaIndex embedding model used by semantic memory and grounding.
+
+These tests run against a local fake OpenAI server, so they do not need access to a real LLM API.
+"""
+import sys
+
+import pytest
+from llama_index.core.embeddings import MockEmbedding
+
+# Insert paths at the beginning of sys.path (position 0)
+sys.path.insert(0, "..")
+sys.path.insert(0, "../../")
+sys.path.insert(0, "../../tinytroupe/")
+
+from testing_utils import *
+
+from tinytroupe import config_manager
+from tinytroupe.clients.embedding_cache import CachedEmbedding, EmbeddingCache, embedding_cache_key
+from tinytroupe.clients.openai_client import OpenAIClient
+
+
+@pytest.fixture
+def embedding_cache_directory(tmp_path):
+    original_cache_embeddings = config_manager.get("cache_embeddings")
+    original_directory = config_manager.get("embedding_cache_directory")
+    config_manager.update("cache_embeddings", True)
+    config_manager.update("embedding_cache_directory", str(tmp_path / "embeddings_cache.cache.d"))
+    yield config_manager.get("embedding_cache_directory")
+    config_manager.update("cache_embeddings", original_cache_embeddings)
+    config_manager.update("embedding_cache_directory", original_directory)
+
+
+# the batches of texts actually embedded by `CountingEmbedding`
+embedded_batches = []
+
+
+class CountingEmbedding(MockEmbedding):
+    def _get_text_embeddings(self, texts):
+        embedded_batches.append(list(texts))
+        return super()._get_text_embeddings(texts)
+
+
+def test_embedding_cache_key():
+    assert embedding_cache_key("model-a", "Hello") == embedding_cache_key("model-a", "Hello")
+    assert embedding_cache_key("model-a", "Hello") != embedding_cache_key("model-b", "Hello")
+    assert embedding_cache_key("model-a", "Hello") != embedding_cache_key("model-a", "Hello!")
+
+
+def test_get_or_compute_only_embeds_missing_texts(tmp_path):
+    cache = EmbeddingCache(str(tmp_path / "cache.d"))
+    computed = []
+
+    def aux_compute(texts):
+        computed.append(texts)
+        return [[float(len(text)), 0.5] for text in texts]
+
+    first = cache.get_or_compute("model", ["a", "bb", "a"], aux_compute)
+    second = cache.get_or_compute("model", ["bb", "ccc"], aux_compute)
+
+    assert computed == [["a", "bb"], ["ccc"]]
+    assert first == [[1.0, 0.5], [2.0, 0.5], [1.0, 0.5]]
+    assert second == [[2.0, 0.5], [3.0, 0.5]]
+
+    # the embeddings survive reopening the cache
+    cache.close()
+    reopened = EmbeddingCache(str(tmp_path / "cache.d"))
+    assert reopened.get_many("model", ["a", "ccc", "dddd"]) == [[1.0, 0.5], [3.0, 0.5], None]
+    assert reopened.get_many("other-model", ["a"]) == [None]
+
+
+def test_get_embeddings_batches_and_caches(fake_openai_server, embedding_cache_directory):
+    client = OpenAIClient(cache_api_calls=False)
+    texts = [f"Text number {i}" for i in range(5)]
+
+    original_batch_size = config_manager.get("embedding_batch_size")
+    config_manager.update("embedding_batch_size", 2)
+    try:
+        embeddings = client.get_embeddings(texts, model="text-embedding-3-small")
+    finally:
+        config_manager.update("embedding_batch_size", original_batch_size)
+
+    assert embeddings == [FakeOpenAIServer.fake_embedding(text) for text in texts]
+    assert [len(request["input"]) for request in fake_openai_server.requests] == [2, 2, 1]
+
+    # everything is taken from the cache the second time, including through `get_embedding`
+    assert client.get_embeddings(texts, model="text-embedding-3-small") == embeddings
+    assert client.get_embedding(texts[0], model="text-embedding-3-small") == embeddings[0]
+    assert len(fake_openai_server.requests) == 3
+
+    stats = client.get_cost_stats()
+    assert stats["embedding_calls"] == 3
+    assert stats["embedded_texts"] == 5
+    assert stats["cached_embeddings"] == 6
+
+
+def test_cached_llamaindex_embedding(tmp_path):
+    embedded_batches.clear()
+    cache = EmbeddingCache(str(tmp_path / "cache.d"))
+    embed_model = CachedEmbedding(CountingEmbedding(embed_dim=4), cache=cache, queries_as_texts=True)
+
+    first = embed_model.get_text_embedding_batch(["memory one", "memory two"])
+    second = embed_model.get_text_embedding_batch(["memory two", "memory three"])
+    query = embed_model.get_query_embedding("memory one")
+
+    assert embedded_batches == [["memory one", "memory two"], ["memory three"]]
+    assert second[0] == first[1]
+    assert query == first[0]
+
+
+class QueryAwareEmbedding(CountingEmbedding):
+    def _get_query_embedding(self, query):
+        return [1.0] * self.embed_dim
+
+
+def test_cached_llamaindex_embedding_without_cache():
+    embedded_batches.clear()
+    original_cache_embeddings = config_manager.get("cache_embeddings")
+    config_manager.update("cache_embeddings", False)
+    try:
+        wrapped_model = QueryAwareEmbedding(embed_dim=4, embed_batch_size=2)
+        embed_model = CachedEmbedding(wrapped_model, embed_batch_size=512)
+
+        # everything is left to the wrapped model, which keeps its own batch size and query embeddings
+        embed_model.get_text_embedding_batch(["one", "two", "three"])
+        assert embedded_batches == [["one", "two"], ["three"]]
+        assert wrapped_model.embed_batch_size == 2
+
+        assert embed_model.get_query_embedding("one") == [1.0] * 4
+        assert embed_model.get_query_embedding_batch(["one", "two"]) == [[1.0] * 4, [1.0] * 4]
+    finally:
+        config_manager.update("cache_embeddings", original_cache_embeddings)
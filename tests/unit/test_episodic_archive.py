@@ -0,0 +1,74 @@
+import json
+import sys
+
+import pytest
+
+# Insert paths at the beginning of sys.path (position 0)
+sys.path.insert(0, "../../tinytroupe/")
+sys.path.insert(0, "../../")
+sys.path.insert(0, "..")
+
+from testing_utils import *
+
+from tinytroupe.agent.episodic_archive import EpisodicArchive
+
+
+def _events(n, start=0):
+    return [{"content": f"event{i}", "type": "action" if i % 3 == 0 else "stimulus",
+             "simulation_timestamp": f"2024-01-01T{i % 24:02d}:00:00"} for i in range(start, start + n)]
+
+
+@pytest.mark.core
+def test_append_and_read(tmp_path):
+    archive = EpisodicArchive.create(str(tmp_path))
+    events = _events(10)
+
+    assert archive.append(events[:4]) is archive
+    assert archive.append(events[4:]) is archive
+
+    assert len(archive) == 10
+    assert archive.events(range(10)) == events
+    assert archive.events([7, 2, 9]) == [events[7], events[2], events[9]]
+    with pytest.raises(IndexError):
+        archive.events([10])
+
+
+def test_positions_by_type(tmp_path, monkeypatch):
+    # small scan chunks, so that searches go through several of them
+    monkeypatch.setattr(EpisodicArchive, "SCAN_CHUNK_LENGTH", 4)
+    archive = EpisodicArchive.create(str(tmp_path)).append(_events(30))
+    actions = [i for i in range(30) if i % 3 == 0]
+
+    assert archive.count("action") == len(actions)
+    assert archive.count("unknown") == 0
+    assert archive.positions("action", 0, 3) == actions[:3]
+    assert archive.positions("action", 7, 10) == actions[7:]
+    assert archive.positions("action", 2, 9) == actions[2:9]
+    assert archive.positions("unknown", 0, 3) == []
+    assert list(archive.iterate_positions_from_last("action")) == actions[::-1]
+    assert list(archive.iterate_positions_from_last()) == list(range(30))[::-1]
+
+
+def test_positions_in_time_range(tmp_path):
+    archive = EpisodicArchive.create(str(tmp_path)).append(_events(10) + [{"content": "undated", "type": "action"}])
+
+    assert archive.positions_in_time_range("2024-01-01T03:00:00", "2024-01-01T06:00:00") == [3, 4, 5, 6]
+    assert archive.positions_in_time_range(start="2024-01-01T05:00:00", item_type="action") == [6, 9]
+    assert archive.positions_in_time_range() == list(range(10))
+
+
+def test_reference_and_fork(tmp_path):
+    archive = EpisodicArchive.create(str(tmp_path)).append(_events(5))
+    reference = json.loads(json.dumps(archive.reference()))
+
+    archive = archive.append(_events(3, start=5))
+
+    # an archive opened from an older reference sees only the events it had, and forks when appending others
+    older = EpisodicArchive.from_reference(reference)
+    assert older.events(range(len(older))) == _events(5)
+
+    forked = older.append(_events(2, start=100))
+    assert forked.path_prefix != archive.path_prefix
+    assert forked.events(range(len(forked))) == _events(5) + _events(2, start=100)
+    assert archive.events(range(len(archive))) == _events(8)
+    assert EpisodicArchive.from_reference(None) is None
@@ -10,11 +10,16 @@ sys.path.insert(0, '../../tinytroupe/')
 sys.path.insert(0, '../../')
 sys.path.insert(0, '..')
 
+from llama_index.core import Document, Settings, VectorStoreIndex
+from llama_index.core.embeddings import MockEmbedding
+
+from tinytroupe import config_manager
 from tinytroupe.agent.grounding import (
     GroundingConnector, 
     BaseSemanticGroundingConnector,
     LocalFilesGroundingConnector,
-    WebPagesGroundingConnector
+    WebPagesGroundingConnector,
+    SemanticIndexSnapshot
 )
 from tinytroupe.examples import create_oscar_the_architect
 from testing_utils import *
@@ -39,6 +44,32 @@ def temp_folder():
     # Cleanup
     shutil.rmtree(temp_dir)
 
+@pytest.fixture
+def mock_embedding():
+    """Embed texts locally, so that indexes can be built without access to an embedding API."""
+    original_embed_model = Settings.embed_model
+    Settings.embed_model = MockEmbedding(embed_dim=8)
+    yield Settings.embed_model
+    Settings.embed_model = original_embed_model
+
+@pytest.fixture
+def grounding_index_directory(tmp_path):
+    original_directory = config_manager.get("grounding_index_directory")
+    config_manager.update("grounding_index_directory", str(tmp_path / "grounding_indexes.d"))
+    yield config_manager.get("grounding_index_directory")
+    config_manager.update("grounding_index_directory", original_directory)
+
+def _connector_with_documents():
+    documents = [
+        Document(text="A guide to sustainable architecture.", metadata={"semantic_memory_id": "guide.txt"}),
+        Document(text="Construction materials and engineering.", metadata={"semantic_memory_id": "materials.txt"}),
+    ]
+
+    connector = BaseSemanticGroundingConnector(name="snapshot_test")
+    connector.documents = documents
+    connector.index = VectorStoreIndex.from_documents(documents, store_nodes_override=True)
+    return connector
+
 def test_grounding_connector_abstract():
     """Test that GroundingConnector is properly abstract."""
     
@@ -216,3 +247,87 @@ def test_grounding_connector_search_edge_cases(temp_folder):
     results = connector.retrieve_relevant("architecture", top_k=1000)
     assert isinstance(results, list), "Should handle high top_k values"
     assert len(results) <= len(connector.documents), "Should not return more than available documents"
+
+def test_grounding_index_serialized_as_snapshot_reference(mock_embedding, grounding_index_directory):
+    """Test that the index is serialized as a reference to a binary snapshot, loaded only when needed."""
+
+    connector = _connector_with_documents()
+
+    serialized = connector.to_json()
+    snapshot_json = serialized["index"]
+    assert snapshot_json["json_serializable_class_name"] == "SemanticIndexSnapshot"
+    assert snapshot_json["node_count"] == 2
+    assert os.path.dirname(snapshot_json["path"]) == grounding_index_directory
+    assert os.path.exists(snapshot_json["path"])
+
+    # serializing an unchanged index again refers to the same snapshot
+    assert connector.to_json()["index"] == snapshot_json
+    assert len(os.listdir(grounding_index_directory)) == 1
+
+    restored = BaseSemanticGroundingConnector.from_json(serialized)
+    assert isinstance(restored.index, SemanticIndexSnapshot)
+
+    # an index that is never used is serialized without being loaded
+    assert restored.to_json()["index"] == snapshot_json
+    assert isinstance(restored.index, SemanticIndexSnapshot)
+
+    results = restored.retrieve_relevant("architecture", top_k=2)
+    assert len(results) == 2
+    assert isinstance(restored.index, VectorStoreIndex)
+    assert restored.index.storage_context.vector_store.data.embedding_dict == \
+           connector.index.storage_context.vector_store.data.embedding_dict
+
+def test_grounding_index_rebuilt_when_snapshot_is_missing(mock_embedding, grounding_index_directory):
+    """Test that the index is rebuilt from the documents if its snapshot is gone."""
+
+    serialized = _connector_with_documents().to_json()
+    os.remove(serialized["index"]["path"])
+
+    restored = BaseSemanticGroundingConnector.from_json(serialized)
+
+    assert len(restored.retrieve_relevant("architecture", top_k=5)) == 2
+
+def test_grounding_index_snapshot_found_after_moving(mock_embedding, grounding_index_directory, tmp_path):
+    """Test that a snapshot file moved elsewhere (e.g., to another machine) is found in the configured directory."""
+
+    serialized = _connector_with_documents().to_json()
+    assert os.path.isabs(serialized["index"]["path"])
+
+    moved_directory = str(tmp_path / "moved_indexes.d")
+    shutil.move(grounding_index_directory, moved_directory)
+    config_manager.update("grounding_index_directory", moved_directory)
+
+    restored = BaseSemanticGroundingConnector.from_json(serialized)
+    assert restored._loaded_index() is not None
+    assert os.path.dirname(restored.to_json()["index"]["path"]) == moved_directory
+
+def test_grounding_index_inlined_without_directory(mock_embedding, tmp_path, monkeypatch):
+    """Test that without a snapshot directory the index is serialized inline, so that it is self-contained."""
+
+    original_directory = config_manager.get("grounding_index_directory")
+    config_manager.update("grounding_index_directory", None)
+    monkeypatch.chdir(tmp_path)
+    try:
+        serialized = _connector_with_documents().to_json()
+    finally:
+        config_manager.update("grounding_index_directory", original_directory)
+
+    assert serialized["index"]["path"] is None
+    assert serialized["index"]["data"] is not None
+    assert os.listdir(tmp_path) == []
+
+    restored = BaseSemanticGroundingConnector.from_json(serialized)
+    assert len(restored.retrieve_relevant("architecture", top_k=2)) == 2
+    assert len(restored.index.index_struct.nodes_dict) == serialized["index"]["node_count"]
+
+def test_grounding_index_from_older_inlined_format(mock_embedding, tmp_path):
+    """Test that indexes serialized in the older format, as the inlined files of the storage context, still load."""
+
+    connector = _connector_with_documents()
+    connector.index.storage_context.persist(persist_dir=str(tmp_path))
+    inlined = {filename: (tmp_path / filename).read_text(encoding="utf-8") for filename in os.listdir(tmp_path)}
+
+    index = BaseSemanticGroundingConnector._deserialize_index(inlined)
+
+    assert isinstance(index, VectorStoreIndex)
+    assert len(index.index_struct.nodes_dict) == 2
@@ -16,7 +16,11 @@ sys.path.insert(0, "..")
 
 from testing_utils import *
 
-from tinytroupe.agent.grounding import BaseSemanticGroundingConnector
+from llama_index.core import Settings
+from llama_index.core.embeddings import MockEmbedding
+from pydantic import PrivateAttr
+
+from tinytroupe import config_manager
 from tinytroupe.agent.memory import (
     EpisodicConsolidator,
     EpisodicMemory,
@@ -25,6 +29,45 @@ from tinytroupe.agent.memory import (
     SemanticMemory,
     TinyMemory,
 )
+from tinytroupe.agent.consolidation import EpisodeConsolidationService
+from tinytroupe.agent.vector_store import NumpyVectorStore, SharedVectorStore
+
+
+EMBEDDING_KEYWORDS = ["berlin", "solar", "budget", "customers", "walk", "store"]
+
+
+class KeywordEmbedding(MockEmbedding):
+    """
+    A toy embedding model, where each dimension counts the occurrences of a keyword, so that texts about
+    the same topics are similar. Also records the texts it embeds.
+    """
+
+    _embedded_texts: list = PrivateAttr(default_factory=list)
+
+    def __init__(self, **kwargs):
+        super().__init__(embed_dim=len(EMBEDDING_KEYWORDS) + 1, **kwargs)
+
+    def _embed(self, text):
+        text = text.lower()
+        return [float(text.count(keyword)) for keyword in EMBEDDING_KEYWORDS] + [0.1]
+
+    def _get_text_embedding(self, text):
+        self._embedded_texts.append(text)
+        return self._embed(text)
+
+    def _get_text_embeddings(self, texts):
+        return [self._get_text_embedding(text) for text in texts]
+
+    def _get_query_embedding(self, query):
+        return self._embed(query)
+
+
+@pytest.fixture
+def keyword_embedding():
+    original_embed_model = Settings.embed_model
+    Settings.embed_model = KeywordEmbedding()
+    yield Settings.embed_model
+    Settings.embed_model = original_embed_model
 
 
 class TestTinyMemory:
@@ -368,6 +411,104 @@ class TestEpisodicMemory:
         with pytest.raises(NotImplementedError):
             memory.retrieve_relevant("test query", top_k=5)
 
+    @staticmethod
+    def _store_events(memory, n, episode_length=7):
+        events = []
+        for i in range(n):
+            event = {"content": f"test{i}", "type": ["stimulus", "action", "feedback"][i % 3 if i % 5 else 1]}
+            memory.store(event)
+            events.append(event)
+            if i % episode_length == episode_length - 1:
+                memory.commit_episode()
+
+        return events
+
+    @staticmethod
+    def _assert_retrievals_match(memory, events):
+        def of_type(item_type):
+            return events if item_type is None else [event for event in events if event["type"] == item_type]
+
+        assert memory.count() == len(events)
+        for item_type in [None, "stimulus", "action", "feedback", "unknown"]:
+            expected = of_type(item_type)
+            assert memory.retrieve_all(item_type=item_type) == expected
+            assert memory.retrieve_first(4, include_omission_info=False, item_type=item_type) == expected[:4]
+            assert memory.retrieve_last(4, include_omission_info=False, item_type=item_type) == expected[-4:]
+            assert list(memory.iterate_from_last(item_type=item_type)) == expected[::-1]
+
+            recent = memory.retrieve_recent(include_omission_info=False, item_type=item_type)
+            if len(expected) > memory.fixed_prefix_length + memory.lookback_length:
+                assert recent == expected[:memory.fixed_prefix_length] + expected[-memory.lookback_length:]
+            else:
+                assert recent == expected
+
+    def test_retrievals_across_episodes(self, setup):
+        """Test that retrievals see committed and current episodes as a single sequence"""
+        memory = EpisodicMemory(fixed_prefix_length=3, lookback_length=5)
+        events = self._store_events(memory, 40)
+        self._assert_retrievals_match(memory, events)
+
+        # the index follows the events, even if they are replaced outside of the memory methods
+        restored = EpisodicMemory.from_json(json.loads(json.dumps(memory.to_json())))
+        self._assert_retrievals_match(restored, events)
+
+        memory.clear(max_prefix_to_clear=10)
+        self._assert_retrievals_match(memory, events[10:35])
+
+    def test_archive_old_events(self, setup, tmp_path):
+        """Test that old events are archived on disk, and still retrieved as if they were in RAM"""
+        original_directory = config_manager.get("episodic_memory_archive_directory")
+        config_manager.update("episodic_memory_archive_directory", str(tmp_path))
+        try:
+            memory = EpisodicMemory(fixed_prefix_length=3, lookback_length=5, max_events_in_ram=10)
+            events = self._store_events(memory, 100)
+
+            assert len(memory.memory) <= 10
+            assert len(memory.archive) + len(memory.memory) == 98
+            self._assert_retrievals_match(memory, events)
+
+            # serialized states refer to the archive, rather than including the archived events
+            state = json.loads(json.dumps(memory.to_json()))
+            assert len(state["memory"]) == len(memory.memory)
+            assert state["archive"] == {"path_prefix": memory.archive.path_prefix, "length": len(memory.archive)}
+            restored = EpisodicMemory.from_json(state)
+            self._assert_retrievals_match(restored, events)
+
+            # restored and copied memories can go on storing events, without affecting each other
+            copied = copy.deepcopy(memory)
+            more_events = self._store_events(memory, 30)
+            other_events = self._store_events(copied, 20)
+            self._assert_retrievals_match(memory, events + more_events)
+            self._assert_retrievals_match(copied, events + other_events)
+            self._assert_retrievals_match(restored, events)
+            assert copied.archive.path_prefix != memory.archive.path_prefix
+
+            memory.clear(max_suffix_to_clear=8)
+            assert memory.archive is None
+            self._assert_retrievals_match(memory, (events + more_events)[:120])
+        finally:
+            config_manager.update("episodic_memory_archive_directory", original_directory)
+
+    def test_retrieve_in_time_range(self, setup, tmp_path):
+        """Test retrieving memories by simulation timestamp, both archived and in RAM"""
+        original_directory = config_manager.get("episodic_memory_archive_directory")
+        config_manager.update("episodic_memory_archive_directory", str(tmp_path))
+        try:
+            memory = EpisodicMemory(fixed_prefix_length=2, lookback_length=2, max_events_in_ram=4)
+            for day in range(1, 11):
+                memory.store({"content": f"day{day}", "type": "stimulus" if day % 2 else "action",
+                              "simulation_timestamp": f"2024-01-{day:02d}T10:00:00"})
+                memory.commit_episode()
+            memory.store({"content": "undated", "type": "stimulus", "simulation_timestamp": None})
+
+            assert memory.archive is not None
+            assert [m["content"] for m in memory.retrieve_in_time_range("2024-01-03", "2024-01-08T23:00:00")] == \
+                ["day3", "day4", "day5", "day6", "day7", "day8"]
+            assert [m["content"] for m in memory.retrieve_in_time_range(start="2024-01-07", item_type="action")] == \
+                ["day8", "day10"]
+            assert len(memory.retrieve_in_time_range()) == 10
+        finally:
+            config_manager.update("episodic_memory_archive_directory", original_directory)
 
 class TestSemanticMemory:
     """Test cases for SemanticMemory class"""
@@ -378,11 +519,10 @@ class TestSemanticMemory:
         # Default initialization
         memory = SemanticMemory()
         assert hasattr(memory, "memories")
-        assert hasattr(memory, "semantic_grounding_connector")
+        assert hasattr(memory, "vector_store")
         assert memory.memories == []
-        assert isinstance(
-            memory.semantic_grounding_connector, BaseSemanticGroundingConnector
-        )
+        assert isinstance(memory.vector_store, NumpyVectorStore)
+        assert len(memory.vector_store) == 0
 
         # Initialize with existing memories
         existing_memories = [{"content": "test", "type": "information"}]
@@ -470,13 +610,10 @@ class TestSemanticMemory:
         assert processed["simulation_timestamp"] is None
 
     @patch("tinytroupe.agent.memory.logger")
-    def test_store(self, mock_logger, setup):
+    def test_store(self, mock_logger, setup, keyword_embedding):
         """Test storing values in semantic memory"""
         memory = SemanticMemory()
 
-        # Mock the semantic grounding connector
-        memory.semantic_grounding_connector = Mock()
-
         value = {
             "content": "I learned something new",
             "type": "action",
@@ -488,8 +625,10 @@ class TestSemanticMemory:
         # Check that the value was added to memories list
         assert len(memory.memories) == 1
 
-        # Check that add_document was called on the connector
-        memory.semantic_grounding_connector.add_document.assert_called_once()
+        # Check that the value was embedded and indexed
+        assert len(keyword_embedding._embedded_texts) == 1
+        assert len(memory.vector_store) == 1
+        assert memory.vector_store.ids.tolist() == [0]
 
         # Verify the stored memory structure
         stored_memory = memory.memories[0]
@@ -535,40 +674,20 @@ class TestSemanticMemory:
 
         assert len(memory.memories) == len(knowledge_snippets)
 
-        connector = memory.semantic_grounding_connector
-        assert connector is not None
-        assert len(connector.documents) == len(knowledge_snippets)
-        assert connector.index is not None
-
-        vector_store = connector.index.storage_context.vector_store
-        store_data = getattr(vector_store, "data", None) or getattr(vector_store, "_data", None)
-        assert store_data is not None, "Vector store data should be available"
-        embedding_dict = getattr(store_data, "embedding_dict", None)
-        if embedding_dict is None and hasattr(store_data, "to_dict"):
-            embedding_dict = store_data.to_dict().get("embedding_dict")
-        assert embedding_dict is not None
+        # long memories are indexed in several chunks
+        vector_store = memory.vector_store
+        assert len(vector_store) > len(knowledge_snippets)
+        assert set(vector_store.ids.tolist()) == set(range(len(knowledge_snippets)))
 
         print("Computed embeddings:")
-        for doc_id, embedding in embedding_dict.items():
-            embedding_sequence = (
-                embedding.tolist() if hasattr(embedding, "tolist") else embedding
-            )
-            if not isinstance(embedding_sequence, list):
-                embedding_sequence = list(embedding_sequence)
-            preview = embedding_sequence[:8]
-            print(f"  {doc_id}: dimension={len(embedding_sequence)} preview={preview}")
+        for memory_index, vector in zip(vector_store.ids.tolist(), vector_store.vectors):
+            print(f"  {memory_index}: dimension={len(vector)} preview={vector[:8].tolist()}")
 
         for stored_memory, snippet in zip(memory.memories, knowledge_snippets):
             assert stored_memory["type"] == "information"
             assert stored_memory["content"].startswith("# Information")
             assert snippet["expanded_content"] in stored_memory["content"]
 
-        for document, snippet in zip(connector.documents, knowledge_snippets):
-            doc_payload = json.loads(document.text)
-            assert doc_payload["type"] == "information"
-            assert doc_payload["content"].startswith("# Information")
-            assert snippet["expanded_content"] in doc_payload["content"]
-
         query = "Berlin"
         search_results = memory.retrieve_relevant(query, top_k=3)
 
@@ -587,47 +706,119 @@ class TestSemanticMemory:
         )
 
     @pytest.mark.core
-    def test_retrieve_relevant(self, setup):
+    def test_retrieve_relevant(self, setup, keyword_embedding):
         """Test retrieving relevant memories"""
         memory = SemanticMemory()
+        memory.store_all([
+            {"content": "I walked to the store.", "type": "action", "simulation_timestamp": None},
+            {"content": "Berlin is adopting solar energy.", "type": "information", "simulation_timestamp": None},
+            {"content": "Customers like the budget assistant.", "type": "information", "simulation_timestamp": None},
+        ])
 
-        # Mock the semantic grounding connector
-        memory.semantic_grounding_connector = Mock()
-        expected_results = [{"content": "relevant memory"}]
-        memory.semantic_grounding_connector.retrieve_relevant.return_value = (
-            expected_results
-        )
+        # all memories are embedded at once
+        assert len(keyword_embedding._embedded_texts) == 3
 
-        results = memory.retrieve_relevant("test query", top_k=10)
+        results = memory.retrieve_relevant("solar panels in Berlin", top_k=2)
 
-        # Verify the connector was called correctly
-        memory.semantic_grounding_connector.retrieve_relevant.assert_called_once_with(
-            "test query", 10
-        )
+        assert len(results) == 2
+        assert results[0].startswith("SOURCE: (unknown)\nSIMILARITY SCORE:")
+        assert "Berlin is adopting solar energy." in results[0]
 
-        # Verify the results
-        assert results == expected_results
+        # empty queries retrieve nothing
+        assert memory.retrieve_relevant("   ") == []
+
+    def test_retrieve_relevant_after_deserialization(self, setup, keyword_embedding):
+        """Test that deserialized memories are retrievable without embedding them again"""
+        memory = SemanticMemory()
+        memory.store({"content": "Berlin is adopting solar energy.", "type": "information", "simulation_timestamp": None})
+        memory.store({"content": "I walked to the store.", "type": "action", "simulation_timestamp": None})
+
+        restored = SemanticMemory.from_json(json.loads(json.dumps(memory.to_json())))
+        keyword_embedding._embedded_texts.clear()
+
+        results = restored.retrieve_relevant("store", top_k=1)
+
+        assert keyword_embedding._embedded_texts == []
+        assert "I walked to the store." in results[0]
+        assert restored.vector_store.vectors.dtype == memory.vector_store.vectors.dtype
+        assert (restored.vector_store.vectors == memory.vector_store.vectors).all()
+
+        # memories stored later are appended to the restored index
+        restored.store({"content": "Customers like the budget assistant.", "type": "information", "simulation_timestamp": None})
+        assert restored.vector_store.ids.tolist() == [0, 1, 2]
+
+    def test_memories_are_indexed_lazily(self, setup, keyword_embedding):
+        """Test that memories without vectors (e.g., from older saved agents) are indexed when first needed"""
+        memory = SemanticMemory(memories=[{"content": "Berlin is adopting solar energy.", "type": "information"}])
+        assert len(memory.vector_store) == 0
+
+        results = memory.retrieve_relevant("Berlin", top_k=5)
+
+        assert len(results) == 1
+        assert len(memory.vector_store) == 1
+
+    def test_retrieve_relevant_batch_from_shared_store(self, setup, keyword_embedding):
+        """Test retrieving from several memories attached to a shared store at once"""
+        shared_store = SharedVectorStore()
+
+        alice_memory = SemanticMemory()
+        alice_memory.store({"content": "Berlin is adopting solar energy.", "type": "information", "simulation_timestamp": None})
+        alice_memory.attach_to_shared_store(shared_store, "Alice")
+
+        bob_memory = SemanticMemory()
+        bob_memory.attach_to_shared_store(shared_store, "Bob")
+        bob_memory.store({"content": "I walked to the store.", "type": "action", "simulation_timestamp": None})
+        bob_memory.store({"content": "Customers like the budget assistant.", "type": "information", "simulation_timestamp": None})
+
+        assert shared_store.count("Alice") == 1
+        assert shared_store.count("Bob") == 2
+
+        results = SemanticMemory.retrieve_relevant_batch([alice_memory, bob_memory], ["store", "store"], top_k=1)
+
+        # each memory only retrieves its own values, and the same as it would on its own
+        assert "Berlin is adopting solar energy." in results[0][0]
+        assert "I walked to the store." in results[1][0]
+        assert results[1] == bob_memory.retrieve_relevant("store", top_k=1)
+
+        # the memories are serialized on their own, not along with the whole shared store
+        restored = SemanticMemory.from_json(json.loads(json.dumps(bob_memory.to_json())))
+        assert isinstance(restored.vector_store, NumpyVectorStore)
+        assert restored.vector_store.ids.tolist() == [0, 1]
+
+    def test_store_all_batch(self, setup, keyword_embedding):
+        """Test storing values in several memories at once, with a single embedding call"""
+        alice_memory = SemanticMemory()
+        bob_memory = SemanticMemory()
+
+        with patch.object(
+            KeywordEmbedding, "get_text_embedding_batch", autospec=True, side_effect=KeywordEmbedding.get_text_embedding_batch
+        ) as embed:
+            SemanticMemory.store_all_batch(
+                [alice_memory, bob_memory],
+                [
+                    [{"content": "Berlin is adopting solar energy.", "type": "consolidated", "simulation_timestamp": None}],
+                    [
+                        {"content": "I walked to the store.", "type": "consolidated", "simulation_timestamp": None},
+                        {"content": "Customers like the budget assistant.", "type": "consolidated", "simulation_timestamp": None},
+                    ],
+                ],
+            )
+            embed.assert_called_once()
+
+        assert len(alice_memory.vector_store) == 1
+        assert bob_memory.vector_store.ids.tolist() == [0, 1]
+        assert "Berlin is adopting solar energy." in alice_memory.retrieve_relevant("solar", top_k=1)[0]
+        assert "I walked to the store." in bob_memory.retrieve_relevant("store", top_k=1)[0]
 
     @pytest.mark.core
     def test_retrieve_all(self, setup):
         """Test retrieving all memories from semantic storage"""
-        memory = SemanticMemory()
-
-        # Create mock documents
-        mock_documents = []
         memories_data = [
             {"content": "memory 1", "type": "action"},
             {"content": "memory 2", "type": "stimulus"},
             {"content": "memory 3", "type": "feedback"},
         ]
-
-        for mem in memories_data:
-            mock_doc = Mock()
-            mock_doc.text = json.dumps(mem)
-            mock_documents.append(mock_doc)
-
-        memory.semantic_grounding_connector = Mock()
-        memory.semantic_grounding_connector.documents = mock_documents
+        memory = SemanticMemory(memories=memories_data)
 
         # Test retrieving all memories
         all_memories = memory.retrieve_all()
@@ -640,55 +831,30 @@ class TestSemanticMemory:
         assert len(action_memories) == 1
         assert action_memories[0]["type"] == "action"
 
-    def test_retrieve_all_with_json_error(self, setup):
-        """Test retrieve_all handles JSON decode errors gracefully"""
-        memory = SemanticMemory()
-
-        # Create a mock document with invalid JSON
-        mock_doc = Mock()
-        mock_doc.text = "invalid json {"
-
-        memory.semantic_grounding_connector = Mock()
-        memory.semantic_grounding_connector.documents = [mock_doc]
-
-        with patch("tinytroupe.agent.memory.logger") as mock_logger:
-            memories = memory.retrieve_all()
-
-            # Should return empty list and log warning
-            assert memories == []
-            mock_logger.warning.assert_called_once()
-
-    def test_build_document_from(self, setup):
-        """Test building documents from memories"""
+    def test_memory_text(self, setup):
+        """Test building the indexed text of memories"""
         memory = SemanticMemory()
 
         # Test with dict memory
         dict_memory = {"content": "test content", "type": "action"}
-        document = memory._build_document_from(dict_memory)
-
-        assert document.text == json.dumps(dict_memory, ensure_ascii=False)
+        assert memory._memory_text(dict_memory) == json.dumps(dict_memory, ensure_ascii=False)
 
         # Test with non-dict memory
         string_memory = "just a string"
-        document = memory._build_document_from(string_memory)
-
         expected_dict = {"content": string_memory, "type": "information"}
-        assert document.text == json.dumps(expected_dict, ensure_ascii=False)
+        assert memory._memory_text(string_memory) == json.dumps(expected_dict, ensure_ascii=False)
 
-    def test_build_documents_from(self, setup):
-        """Test building multiple documents from memories"""
-        memory = SemanticMemory()
+    def test_chunk_spans(self, setup):
+        """Test splitting long memories into overlapping chunks that cover the whole text"""
+        assert SemanticMemory._chunk_spans("short text") == [(0, 10)]
 
-        memories = [
-            {"content": "memory 1", "type": "action"},
-            {"content": "memory 2", "type": "stimulus"},
-        ]
-
-        documents = memory._build_documents_from(memories)
+        text = "x" * (SemanticMemory.CHUNK_SIZE * 3 + 17)
+        spans = SemanticMemory._chunk_spans(text)
 
-        assert len(documents) == 2
-        assert json.loads(documents[0].text)["content"] == "memory 1"
-        assert json.loads(documents[1].text)["type"] == "stimulus"
+        assert spans[0][0] == 0
+        assert spans[-1][1] == len(text)
+        assert all(end - start <= SemanticMemory.CHUNK_SIZE for start, end in spans)
+        assert all(next_start < end for (_, end), (next_start, _) in zip(spans, spans[1:]))
 
 
 class TestMemoryProcessor:
@@ -803,6 +969,55 @@ class TestEpisodicConsolidator:
                 assert "consolidation" in result
                 assert isinstance(result["consolidation"], list)
 
+    def test_process_many(self, setup):
+        """Test consolidating several short episodes in a single request"""
+        consolidator = EpisodicConsolidator()
+        episodes = [
+            {"memories": [{"content": f"I saw cat {i}", "type": "stimulus"}], "timestamp": "2023-01-01T10:00:00"}
+            for i in range(3)
+        ]
+
+        # the second episode is missing from the result, so it is consolidated on its own
+        mock_result = {
+            "consolidations": [
+                {"episode": 2, "consolidation": [{"content": "cat 2", "type": "consolidated"}]},
+                {"episode": 0, "consolidation": [{"content": "cat 0", "type": "consolidated"}]},
+            ]
+        }
+        with patch.object(consolidator, "_consolidate_many", return_value=mock_result), patch.object(
+            consolidator, "_consolidate", return_value={"consolidation": [{"content": "cat 1", "type": "consolidated"}]}
+        ):
+            results = consolidator.process_many(episodes)
+
+            consolidator._consolidate_many.assert_called_once()
+            consolidator._consolidate.assert_called_once()
+
+        assert [result["consolidation"][0]["content"] for result in results] == ["cat 0", "cat 1", "cat 2"]
+
+    def test_process_many_with_string_episode_numbers(self, setup):
+        """Test that episode numbers echoed back as strings still match their episodes"""
+        consolidator = EpisodicConsolidator()
+        episodes = [
+            {"memories": [{"content": f"I saw cat {i}", "type": "stimulus"}], "timestamp": "2023-01-01T10:00:00"}
+            for i in range(2)
+        ]
+
+        mock_result = {
+            "consolidations": [
+                {"episode": "1", "consolidation": [{"content": "cat 1", "type": "consolidated"}]},
+                {"episode": "0", "consolidation": [{"content": "cat 0", "type": "consolidated"}]},
+                {"episode": "first", "consolidation": [{"content": "cat ?", "type": "consolidated"}]},
+            ]
+        }
+        with patch.object(consolidator, "_consolidate_many", return_value=mock_result), patch.object(
+            consolidator, "_consolidate"
+        ):
+            results = consolidator.process_many(episodes)
+
+            consolidator._consolidate.assert_not_called()
+
+        assert [result["consolidation"][0]["content"] for result in results] == ["cat 0", "cat 1"]
+
     def test_consolidate_method_structure(self, setup):
         """Test that _consolidate method exists and has correct signature"""
         consolidator = EpisodicConsolidator()
@@ -816,6 +1031,118 @@ class TestEpisodicConsolidator:
         # But we can test that the method exists and has the expected signature
 
 
+class TestEpisodeConsolidationService:
+    """Test cases for the background consolidation of episodes"""
+
+    class Agent:
+        def __init__(self, name):
+            self.name = name
+            self.semantic_memory = SemanticMemory()
+
+    @staticmethod
+    def _episode(agent_name):
+        return [{"content": f"{agent_name} saw a cat", "type": "stimulus"}]
+
+    def test_consolidates_in_background(self, setup, keyword_embedding):
+        """Test that episodes are consolidated with bounded concurrency, packed in agent order when dispatched"""
+        import threading
+
+        first_request_started = threading.Event()
+        release_first_request = threading.Event()
+        requests = []
+
+        def process_many(self, episodes):
+            requests.append([episode["memories"][0]["content"] for episode in episodes])
+            if len(requests) == 1:
+                first_request_started.set()
+                release_first_request.wait(10)
+
+            return [
+                {"consolidation": [{"content": f"consolidated: {episode['memories'][0]['content']}", "type": "consolidated",
+                                    "simulation_timestamp": episode["timestamp"]}]}
+                for episode in episodes
+            ]
+
+        agents = [self.Agent(f"agent{i}") for i in range(4)]
+        service = EpisodeConsolidationService(max_concurrency=1, max_episodes_per_request=2)
+
+        with patch.object(EpisodicConsolidator, "process_many", process_many):
+            # episodes are only sent to be consolidated when dispatched, whatever order they were submitted in
+            for agent in [agents[2], agents[0], agents[3], agents[1]]:
+                service.submit(agent, self._episode(agent.name), timestamp="2023-01-01T10:00:00")
+            assert requests == []
+
+            service.dispatch(agents)
+            assert first_request_started.wait(10)
+
+            # while the only request allowed is running, the other pack waits
+            assert service.is_consolidating(agents[3])
+            service.store_completed()
+            assert len(agents[0].semantic_memory.memories) == 0
+
+            release_first_request.set()
+            service.wait([agents[1]])
+            assert len(agents[1].semantic_memory.memories) == 1
+
+            service.wait()
+            service.store_completed()
+
+        assert requests == [["agent0 saw a cat", "agent1 saw a cat"], ["agent2 saw a cat", "agent3 saw a cat"]]
+        for agent in agents:
+            assert not service.is_consolidating(agent)
+            assert len(agent.semantic_memory.memories) == 1
+            assert f"consolidated: {agent.name} saw a cat" in agent.semantic_memory.memories[0]["content"]
+
+    def test_results_are_stored_in_submission_order(self, setup, keyword_embedding):
+        """Test that the results of an agent are stored in the order its episodes were submitted"""
+        import threading
+
+        release_first_request = threading.Event()
+        second_request_done = threading.Event()
+
+        def process_many(self, episodes):
+            content = episodes[0]["memories"][0]["content"]
+            if content == "first":
+                release_first_request.wait(10)
+            else:
+                second_request_done.set()
+
+            return [{"consolidation": [{"content": f"consolidated: {content}", "type": "consolidated",
+                                        "simulation_timestamp": episodes[0]["timestamp"]}]}]
+
+        agent = self.Agent("agent")
+        service = EpisodeConsolidationService(max_concurrency=2, max_episodes_per_request=1)
+
+        with patch.object(EpisodicConsolidator, "process_many", process_many):
+            service.submit(agent, [{"content": "first", "type": "stimulus"}], timestamp="2023-01-01T10:00:00")
+            service.submit(agent, [{"content": "second", "type": "stimulus"}], timestamp="2023-01-01T10:00:00")
+            service.dispatch()
+
+            # the second episode is consolidated first, but is not stored before the first one
+            assert second_request_done.wait(10)
+            service.store_completed()
+            assert agent.semantic_memory.memories == []
+
+            release_first_request.set()
+            service.wait([agent])
+
+        assert len(agent.semantic_memory.memories) == 2
+        assert "consolidated: first" in agent.semantic_memory.memories[0]["content"]
+        assert "consolidated: second" in agent.semantic_memory.memories[1]["content"]
+
+    def test_failed_consolidations_are_ignored(self, setup):
+        """Test that agents do not wait forever for consolidations that failed"""
+        agent = self.Agent("agent")
+        service = EpisodeConsolidationService(max_concurrency=2, max_episodes_per_request=2)
+
+        with patch.object(EpisodicConsolidator, "process_many", side_effect=RuntimeError("model unavailable")):
+            service.submit(agent, self._episode(agent.name))
+            service.wait([agent])
+
+        assert not service.is_consolidating(agent)
+        assert agent.semantic_memory.memories == []
+
+
 class TestReflectionConsolidator:
     """Test cases for ReflectionConsolidator class (placeholder implementation)"""
 
@@ -906,7 +1233,7 @@ class TestMemoryIntegration:
             assert stored_memory["type"] == "consolidated"
             assert "peaceful walk" in stored_memory["content"]
 
-    def test_memory_filtering_across_types(self, setup):
+    def test_memory_filtering_across_types(self, setup, keyword_embedding):
         """Test memory filtering works consistently across different memory types"""
         episodic_memory = EpisodicMemory()
         semantic_memory = SemanticMemory()
@@ -947,15 +1274,6 @@ class TestMemoryIntegration:
         for memory in test_memories:
             semantic_memory.store(memory)
 
-        # Mock the document retrieval for semantic memory
-        mock_documents = []
-        for memory in test_memories:
-            doc = Mock()
-            doc.text = json.dumps(semantic_memory._preprocess_value_for_storage(memory))
-            mock_documents.append(doc)
-
-        semantic_memory.semantic_grounding_connector.documents = mock_documents
-
         # Test filtering in semantic memory
         actions_semantic = semantic_memory.retrieve_all(item_type="action")
         assert len(actions_semantic) == 2
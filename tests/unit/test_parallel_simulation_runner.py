@@ -0,0 +1,113 @@
+import sys
+
+import pytest
+
+# Insert paths at the beginning of sys.path (position 0)
+sys.path.insert(0, "..")
+sys.path.insert(0, "../../")
+sys.path.insert(0, "../../tinytroupe/")
+
+from testing_utils import *
+
+from tinytroupe.agent import TinyPerson
+from tinytroupe.environment import TinyWorld
+from tinytroupe.experimentation import InPlaceExperimentRunner, ParallelSimulationRunner, SimulationQueue
+from tinytroupe.experimentation.parallel_simulation_runner import _SimulationTask
+
+
+#
+# Simulations run by the workers, which must be importable by them
+#
+def aux_simulation(number_of_agents: int):
+    # every simulation uses the same names, which would clash if simulations shared their registries
+    agents = [TinyPerson(f"Agent {i}") for i in range(number_of_agents)]
+    world = TinyWorld("The World", agents)
+
+    return {"agents": [len(world.agents)], "all_agents": [len(TinyPerson.all_agents)]}
+
+
+def aux_failing_simulation():
+    raise ValueError("Something went wrong in the simulation.")
+
+
+def test_run_in_local_workers(tmp_path):
+    experiment_runner = InPlaceExperimentRunner(str(tmp_path / "experiment_config.json"))
+    experiment_runner.add_experiment("small")
+    experiment_runner.add_experiment("large")
+
+    runner = ParallelSimulationRunner(max_workers=2)
+    for i in range(3):
+        runner.add_simulation(f"small-{i}", aux_simulation, 2, experiment_name="small")
+    runner.add_simulation("large-0", aux_simulation, number_of_agents=5, experiment_name="large")
+    runner.add_simulation("failing", aux_failing_simulation)
+
+    with pytest.raises(ValueError):
+        runner.add_simulation("failing", aux_failing_simulation)
+
+    results = runner.run(experiment_runner=experiment_runner)
+
+    assert results == {
+        "small-0": {"agents": [2], "all_agents": [2]},
+        "small-1": {"agents": [2], "all_agents": [2]},
+        "small-2": {"agents": [2], "all_agents": [2]},
+        "large-0": {"agents": [5], "all_agents": [5]},
+    }
+
+    failed = runner.get_outcomes()["failing"]
+    assert not failed.succeeded
+    assert "Something went wrong" in failed.error
+
+    stats = runner.get_cost_stats()
+    assert stats["num_simulations"] == 5
+    assert stats["failed_simulations"] == 1
+    assert stats["model_calls"] == 0
+
+    assert experiment_runner.get_experiment_results("small") == {"agents": [2, 2, 2], "all_agents": [2, 2, 2]}
+    assert experiment_runner.get_experiment_results("large") == {"agents": [5], "all_agents": [5]}
+
+    # the registries of this process were left untouched
+    assert len(TinyPerson.all_agents) == 0
+
+
+def test_simulation_queue(tmp_path):
+    queue = SimulationQueue(str(tmp_path / "queue"))
+    for i in range(3):
+        queue.submit(_SimulationTask(f"simulation-{i}", aux_simulation, (i + 1,), {}))
+
+    # the simulations of a queue can be run by any process, including this one
+    queue.work()
+
+    outcomes = sorted(queue.outcomes(), key=lambda outcome: outcome.name)
+    assert [outcome.name for outcome in outcomes] == ["simulation-0", "simulation-1", "simulation-2"]
+    assert [outcome.result["agents"] for outcome in outcomes] == [[1], [2], [3]]
+    assert all(outcome.worker is not None for outcome in outcomes)
+
+    # nothing is left to claim
+    assert queue._claim() is None
+
+    queue.clear()
+    assert queue.count_outcomes() == 0
+
+
+def test_worker_own_cache_without_file_locks(tmp_path):
+    from tinytroupe.clients.api_cache import CACHE_BACKEND_SHARDED_LOG, create_api_cache
+    from tinytroupe.experimentation.parallel_simulation_runner import _worker_own_cache_file_name
+
+    cache_file_name = str(tmp_path / "shared_api_cache.pickle")
+    shared_cache = create_api_cache(cache_file_name, CACHE_BACKEND_SHARDED_LOG)
+    shared_cache["key"] = "cached response"
+    shared_cache.close()
+
+    own_cache_file_name = _worker_own_cache_file_name(cache_file_name)
+    assert own_cache_file_name != cache_file_name
+    assert own_cache_file_name.endswith(".pickle")
+
+    # the worker starts from what was cached so far, but its own entries are not shared
+    own_cache = create_api_cache(own_cache_file_name, CACHE_BACKEND_SHARDED_LOG)
+    assert own_cache["key"] == "cached response"
+    own_cache["other key"] = "other response"
+    own_cache.close()
+
+    shared_cache = create_api_cache(cache_file_name, CACHE_BACKEND_SHARDED_LOG)
+    assert "other key" not in shared_cache
+    shared_cache.close()
@@ -0,0 +1,178 @@
+"""
+Tests for the client-side rate limiter.
+"""
+import sys
+import threading
+import time
+
+import pytest
+
+# Insert paths at the beginning of sys.path (position 0)
+sys.path.insert(0, "..")
+sys.path.insert(0, "../../")
+sys.path.insert(0, "../../tinytroupe/")
+
+from testing_utils import *
+
+from tinytroupe.clients.openai_client import OpenAIClient
+from tinytroupe.clients.rate_limiter import (
+    RateLimiter,
+    TokenBucket,
+    _parse_duration,
+    rate_limiter_for,
+    reset_rate_limiters,
+)
+
+
+@pytest.fixture
+def fresh_rate_limiters():
+    reset_rate_limiters()
+    yield
+    reset_rate_limiters()
+
+
+@pytest.mark.core
+def test_token_bucket():
+    bucket = TokenBucket(60)
+    assert bucket.time_until_available(60) == 0.0
+
+    bucket.consume(60)
+    assert bucket.time_until_available(1) == pytest.approx(1.0, abs=0.05)
+
+    bucket.credit(30)
+    assert bucket.time_until_available(30) == 0.0
+
+    # larger than the capacity only needs a full bucket
+    assert bucket.time_until_available(1000) > 0.0
+
+    assert TokenBucket(None).time_until_available(10**9) == 0.0
+
+
+@pytest.mark.core
+def test_requests_per_minute():
+    limiter = RateLimiter("test", requests_per_minute=2)
+
+    with limiter._condition:
+        assert limiter._try_acquire(0)[0] is not None
+        assert limiter._try_acquire(0)[0] is not None
+        reservation, wait_time = limiter._try_acquire(0)
+
+    assert reservation is None
+    assert wait_time == pytest.approx(30.0, abs=0.5)
+
+
+def test_tokens_are_corrected_with_actual_usage():
+    limiter = RateLimiter("test", tokens_per_minute=1000)
+
+    reservation = limiter.acquire(estimated_prompt_tokens=900)
+    with limiter._condition:
+        assert limiter._try_acquire(900)[0] is None
+
+    reservation.record_usage(prompt_tokens=50, completion_tokens=50)
+    limiter.release(reservation)
+
+    with limiter._condition:
+        assert limiter._try_acquire(800)[0] is not None
+
+
+def test_limits_learned_from_headers():
+    limiter = RateLimiter("test", tokens_per_minute=10000)
+    limiter.update_from_headers({
+        "x-ratelimit-limit-requests": "100",
+        "x-ratelimit-limit-tokens": "20000",
+        "x-ratelimit-remaining-tokens": "0",
+    })
+
+    stats = limiter.get_stats()
+    assert stats["requests_per_minute"] == 100
+    assert stats["tokens_per_minute"] == 10000  # configured limits are upper bounds
+
+    with limiter._condition:
+        reservation, wait_time = limiter._try_acquire(100)
+    assert reservation is None and wait_time > 0
+
+
+@pytest.mark.core
+def test_concurrency_adapts_aimd():
+    limiter = RateLimiter("test", max_concurrency=8)
+
+    limiter.on_rate_limited({"retry-after-ms": "1"})
+    assert limiter.concurrency_limit == 4
+    limiter.on_rate_limited({"retry-after-ms": "1"})
+    assert limiter.concurrency_limit == 2
+
+    time.sleep(0.01)
+    for _ in range(10):
+        limiter.release(limiter.acquire())
+    assert 2 < limiter.concurrency_limit <= 8
+    assert limiter.get_stats()["rate_limited_calls"] == 2
+
+
+def test_concurrency_recovers_without_maximum():
+    limiter = RateLimiter("test")
+
+    # a serial caller, rate limited after its call was released
+    with pytest.raises(RuntimeError):
+        with limiter.reserve():
+            raise RuntimeError("429")
+    limiter.on_rate_limited({"retry-after-ms": "1"})
+    assert limiter.concurrency_limit == 1
+    assert limiter.max_concurrency is None
+
+    # concurrency grows back on sustained success, beyond the calls in flight when rate limited
+    time.sleep(0.01)
+    for _ in range(20):
+        limiter.release(limiter.acquire())
+    assert limiter.concurrency_limit > 2
+
+
+def test_concurrency_limit_blocks_until_release():
+    limiter = RateLimiter("test", max_concurrency=1)
+    first = limiter.acquire()
+    acquired = threading.Event()
+
+    def aux_acquire():
+        limiter.release(limiter.acquire())
+        acquired.set()
+
+    thread = threading.Thread(target=aux_acquire)
+    thread.start()
+    assert not acquired.wait(0.2)
+
+    limiter.release(first)
+    assert acquired.wait(2)
+    thread.join()
+
+
+def test_parse_duration():
+    assert _parse_duration("20") == 20
+    assert _parse_duration("120ms") == pytest.approx(0.12)
+    assert _parse_duration("6m0s") == 360
+    assert _parse_duration("1.5s") == 1.5
+    assert _parse_duration("250", default_unit="ms") == 0.25
+    assert _parse_duration(None) is None
+
+
+def test_client_uses_shared_rate_limiter(fake_openai_server, fresh_rate_limiters):
+    fake_openai_server.headers = {"x-ratelimit-limit-requests": "5000", "x-ratelimit-limit-tokens": "800000"}
+    client = OpenAIClient(cache_api_calls=False)
+
+    message = client.send_message([{"role": "user", "content": "Hi!"}], model="gpt-4o-mini")
+
+    assert message["content"] == "Hello from the fake server!"
+    stats = rate_limiter_for("gpt-4o-mini").get_stats()
+    assert stats["calls"] == 1
+    assert stats["requests_per_minute"] == 5000
+    assert stats["tokens_per_minute"] == 800000
+
+
+def test_client_recovers_from_rate_limit_error(fake_openai_server, fresh_rate_limiters):
+    fake_openai_server.headers = {"retry-after-ms": "10"}
+    fake_openai_server.error_statuses = [429]
+    client = OpenAIClient(cache_api_calls=False)
+
+    message = client.send_message([{"role": "user", "content": "Hi!"}], model="gpt-4o-mini")
+
+    assert message["content"] == "Hello from the fake server!"
+    assert len(fake_openai_server.requests) == 2
+    assert rate_limiter_for("gpt-4o-mini").get_stats()["rate_limited_calls"] == 1
@@ -0,0 +1,94 @@
+"""
+Tests for the coalescing of identical concurrent model calls into a single request.
+
+These tests run against a local fake OpenAI server, so they do not need access to a real LLM API.
+"""
+import asyncio
+import sys
+import threading
+
+import pytest
+
+# Insert paths at the beginning of sys.path (position 0)
+sys.path.insert(0, "..")
+sys.path.insert(0, "../../")
+sys.path.insert(0, "../../tinytroupe/")
+
+from testing_utils import *
+
+from tinytroupe import config_manager
+from tinytroupe.clients.openai_client import OpenAIClient
+
+
+def _send_concurrently(client, messages_per_caller):
+    results = [None] * len(messages_per_caller)
+
+    def aux_send(i):
+        results[i] = client.send_message(messages_per_caller[i], model="gpt-4o-mini")
+
+    threads = [threading.Thread(target=aux_send, args=(i,)) for i in range(len(messages_per_caller))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    return results
+
+
+@pytest.mark.core
+def test_identical_concurrent_requests_are_coalesced(fake_openai_server):
+    fake_openai_server.delay = 0.5
+    client = OpenAIClient(cache_api_calls=False)
+
+    results = _send_concurrently(client, [[{"role": "user", "content": "Hi!"}]] * 4)
+
+    assert all(r["content"] == "Hello from the fake server!" for r in results)
+    assert len(fake_openai_server.requests) == 1
+
+    stats = client.get_cost_stats()
+    assert stats["model_calls"] == 1
+    assert stats["coalesced_calls"] == 3
+    assert stats["total_tokens"] == 15
+
+
+def test_different_concurrent_requests_are_not_coalesced(fake_openai_server):
+    fake_openai_server.delay = 0.2
+    client = OpenAIClient(cache_api_calls=False)
+
+    results = _send_concurrently(client, [[{"role": "user", "content": f"Hi {i}!"}] for i in range(3)])
+
+    assert all(r is not None for r in results)
+    assert len(fake_openai_server.requests) == 3
+    assert client.get_cost_stats()["coalesced_calls"] == 0
+
+
+def test_identical_concurrent_async_requests_are_coalesced(fake_openai_server):
+    fake_openai_server.delay = 0.5
+    client = OpenAIClient(cache_api_calls=False)
+
+    async def aux_send_many():
+        return await asyncio.gather(*[
+            client.async_send_message([{"role": "user", "content": "Hi!"}], model="gpt-4o-mini")
+            for _ in range(5)
+        ])
+
+    messages = asyncio.run(aux_send_many())
+
+    assert all(m["content"] == "Hello from the fake server!" for m in messages)
+    assert len(fake_openai_server.requests) == 1
+    assert client.get_cost_stats()["coalesced_calls"] == 4
+
+
+def test_request_coalescing_can_be_disabled(fake_openai_server):
+    fake_openai_server.delay = 0.2
+    client = OpenAIClient(cache_api_calls=False)
+
+    original_value = config_manager.get("coalesce_identical_requests")
+    config_manager.update("coalesce_identical_requests", False)
+    try:
+        _send_concurrently(client, [[{"role": "user", "content": "Hi!"}]] * 3)
+    finally:
+        config_manager.update("coalesce_identical_requests", original_value)
+
+    assert len(fake_openai_server.requests) == 3
+    assert client.get_cost_stats()["coalesced_calls"] == 0
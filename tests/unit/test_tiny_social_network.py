@@ -297,3 +297,28 @@ def test_tiny_social_network_large_scale(setup):
         for j in range(len(agents)):
             if i != j:
                 assert network.is_in_relation_with(agents[i], agents[j]) == True
+
+
+def test_tiny_social_network_skips_idle_agents(setup):
+    """Test that a social network can skip agents with no new stimuli."""
+
+    network = TinySocialNetwork("Idle Test", skip_idle_agents=True, idle_agent_wake_up_interval=10)
+    assert network.skip_idle_agents == True
+    assert network.idle_agent_wake_up_interval == 10
+
+    alice, bob = TinyPerson("Alice"), TinyPerson("Bob")
+    network.add_relation(alice, bob, "friends")
+
+    acted = []
+    for agent in [alice, bob]:
+        def aux_act(return_actions=True, agent=agent):
+            acted.append(agent.name)
+            agent._actions_buffer = []
+            return []
+        agent.act = aux_act
+
+    network.run(2, parallelize=False)
+
+    # each agent acted only in the first step
+    assert sorted(acted) == ["Alice", "Bob"]
+    assert network.get_cost_stats()["skipped_agent_acts"] == 2
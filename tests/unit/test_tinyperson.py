@@ -1,3 +1,5 @@
+import copy
+
 import pytest
 import logging
 logger = logging.getLogger("tinytroupe")
@@ -8,6 +10,7 @@ sys.path.insert(0, '../../') # ensures that the package is imported from the par
 sys.path.insert(0, '..') # ensures that the package is imported from the parent directory, not the Python installation
 
 
+from tinytroupe import config_manager, utils
 from tinytroupe.examples import create_oscar_the_architect, create_oscar_the_architect_2, create_lisa_the_data_scientist, create_lisa_the_data_scientist_2
 
 from testing_utils import *
@@ -63,6 +66,92 @@ def test_define(setup):
         # check that the prompt contains the new value
         assert '25' in agent.current_messages[0]['content'], f"{agent.name} should have the age in the prompt."
 
+@pytest.mark.core
+def test_system_prompt_reuses_static_parts(setup):
+    # the system prompt is assembled from cached static parts, which must give the same result as rendering it fully
+    from tinytroupe.agent import RecallFaculty
+
+    agent = create_oscar_the_architect()
+    agent.listen("Hello, Oscar. How is the new project going?")
+    assert agent.generate_agent_system_prompt() == agent._render_system_prompt_fully()
+
+    # turn-dependent parts are rendered every time
+    agent.listen("Please tell me about the ceiling of the main hall.")
+    assert "ceiling of the main hall" in agent.generate_agent_system_prompt()
+    assert agent.generate_agent_system_prompt() == agent._render_system_prompt_fully()
+
+    # the static parts are rendered again only after the persona or the mental faculties change
+    static_parts = agent._system_prompt_parts
+    agent.reset_prompt()
+    assert agent._system_prompt_parts is static_parts
+
+    agent.define("age", 42)
+    assert agent._system_prompt_parts is not static_parts
+    assert '"age": 42' in agent.generate_agent_system_prompt()
+
+    static_parts = agent._system_prompt_parts
+    agent.add_mental_faculty(RecallFaculty())
+    agent.reset_prompt()
+    assert agent._system_prompt_parts is not static_parts
+    assert "RECALL" in agent.generate_agent_system_prompt()
+    assert agent.generate_agent_system_prompt() == agent._render_system_prompt_fully()
+
+def test_recent_action_similarity(setup):
+    # the recent actions used to detect repetitions must follow the episodic memory, however it changes
+    agent = create_oscar_the_architect()
+
+    def store_action(action_type, content):
+        agent.store_in_memory({"role": "assistant", "content": {"action": {"type": action_type, "content": content, "target": ""}},
+                               "type": "action", "simulation_timestamp": None})
+
+    talk = {"type": "TALK", "content": "The new building will have a green roof.", "target": ""}
+    assert agent.recent_action_similarity(talk) == 0.0
+
+    store_action("TALK", talk["content"])
+    store_action("DONE", "")
+    assert agent.recent_action_similarity(talk) == 1.0
+    assert utils.next_action_jaccard_similarity(agent, talk) == 1.0
+
+    store_action("THINK", "I should check the budget.")
+    store_action("TALK", "Let me show you the plans.")
+    assert agent.recent_action_similarity(talk) < 1.0
+    assert agent.recent_action_similarity(talk, window=3) == 1.0
+
+    agent.clear_episodic_memory()
+    assert agent.recent_action_similarity(talk, window=3) == 0.0
+
+    store_action("TALK", talk["content"])
+    restored = copy.deepcopy(agent.encode_complete_state())
+    store_action("TALK", "Let me show you the plans.")
+    assert agent.recent_action_similarity(talk) < 1.0
+    agent.decode_complete_state(restored)
+    assert agent.recent_action_similarity(talk) == 1.0
+
+def test_prefix_stable_prompt_layout(setup):
+    # the invariant part of the prompt must stay the same across turns, with what changes coming after it
+    original_layout = config_manager.get("prompt_layout")
+    config_manager.update("prompt_layout", "prefix_stable")
+    try:
+        agent = create_oscar_the_architect()
+        agent.listen("Hello, Oscar. How is the new project going?")
+        agent.reset_prompt()
+        first_messages = copy.deepcopy(agent.current_messages)
+
+        agent.move_to("Main hall")
+        agent.listen("Please tell me about the ceiling of the main hall.")
+        agent.reset_prompt()
+
+        assert [message["role"] for message in agent.current_messages] == ["system", "system", "user"]
+        assert agent.current_messages[0] == first_messages[0], "The invariant part of the prompt should not change."
+        assert agent.current_messages[1] != first_messages[1]
+        assert "ceiling of the main hall" in agent.current_messages[1]["content"]
+
+        # both layouts render the same prompt, only split differently
+        assert agent.generate_agent_system_prompt() == \
+               agent.current_messages[0]["content"] + agent.current_messages[1]["content"]
+    finally:
+        config_manager.update("prompt_layout", original_layout)
+
 @pytest.mark.core
 def test_define_several(setup):
     # Test that defining several values to a group works as expected
@@ -2,13 +2,16 @@ import pytest
 import logging
 logger = logging.getLogger("tinytroupe")
 
+import copy
 import sys
+import threading
 # Insert paths at the beginning of sys.path (position 0)
 sys.path.insert(0, '..')
 sys.path.insert(0, '../../')
 sys.path.insert(0, '../../tinytroupe/')
 
 from tinytroupe.examples import create_lisa_the_data_scientist, create_oscar_the_architect, create_marcos_the_physician
+from tinytroupe import config_manager
 from tinytroupe.environment import TinyWorld
 from testing_utils import *
 
@@ -99,3 +102,162 @@ def test_decode_complete_state(setup, focus_group_world):
     assert len(world_2.agents) == n_agents_1, "The world should have the same number of agents."
 
 
+
+
+def _act_with(agent, actions, before_returning=None):
+    """
+    Replaces the agent's `act` with one that returns the given actions, without calling any LLM.
+    """
+    def aux_act(return_actions=True):
+        if before_returning is not None:
+            before_returning()
+        agent._actions_buffer = copy.deepcopy(actions)
+        return actions
+
+    agent.act = aux_act
+
+
+def test_parallel_step_handles_actions_as_agents_finish(setup):
+    from tinytroupe.agent import TinyPerson
+
+    fast, other, slow, eager = TinyPerson("Fast"), TinyPerson("Other"), TinyPerson("Slow"), TinyPerson("Eager")
+    world = TinyWorld("Scheduling land", [fast, other, slow, eager])
+
+    events = []
+    fast_actions_handled = threading.Event()
+
+    def aux_wait_for_fast():
+        # the slow agent only finishes once the fast agent's actions were handled (or after a long while)
+        events.append("Slow saw Fast handled" if fast_actions_handled.wait(timeout=10) else "Slow timed out")
+        events.append("Slow finished")
+
+    _act_with(fast, [{"type": "TALK", "content": "Hi Other", "target": "Other"}, {"type": "DONE", "content": "", "target": ""}])
+    _act_with(other, [{"type": "DONE", "content": "", "target": ""}])
+    _act_with(slow, [{"type": "TALK", "content": "Hi Fast", "target": "Fast"}], before_returning=aux_wait_for_fast)
+    _act_with(eager, [{"type": "TALK", "content": "Hi Slow", "target": "Slow"}])
+
+    original_handle_actions = world._handle_actions
+
+    def aux_handle_actions(source, actions):
+        events.append(f"handled {source.name}")
+        original_handle_actions(source, actions)
+        if source is fast:
+            fast_actions_handled.set()
+
+    world._handle_actions = aux_handle_actions
+
+    agents_actions = world._step(parallelize=True)
+
+    assert list(agents_actions.keys()) == ["Fast", "Other", "Slow", "Eager"]
+    assert "Slow saw Fast handled" in events
+
+    # actions affecting an agent are only handled after that agent finished acting
+    assert events.index("handled Eager") > events.index("Slow finished")
+    assert events.index("handled Slow") > events.index("Slow finished")
+
+    # messages were delivered
+    assert other.stimuli_count == 1
+    assert slow.stimuli_count == 1
+    assert fast.stimuli_count == 1
+
+
+def test_parallel_step_delivers_actions_in_agent_order(setup):
+    from tinytroupe.agent import TinyPerson
+
+    first, second, listener, loner = TinyPerson("First"), TinyPerson("Second"), TinyPerson("Listener"), TinyPerson("Loner")
+    world = TinyWorld("Ordering land", [first, second, listener, loner])
+
+    events = []
+    second_finished = threading.Event()
+
+    def aux_wait_for_second():
+        # the first agent only finishes after the second one (or after a long while)
+        second_finished.wait(timeout=10)
+        events.append("First finished")
+
+    _act_with(first, [{"type": "TALK", "content": "Hi from First", "target": "Listener"}], before_returning=aux_wait_for_second)
+    _act_with(second, [{"type": "TALK", "content": "Hi from Second", "target": "Listener"}], before_returning=second_finished.set)
+    _act_with(listener, [{"type": "DONE", "content": "", "target": ""}])
+    _act_with(loner, [{"type": "TALK", "content": "Hi Second", "target": "Second"}])
+
+    original_handle_actions = world._handle_actions
+
+    def aux_handle_actions(source, actions):
+        events.append(f"handled {source.name}")
+        original_handle_actions(source, actions)
+
+    world._handle_actions = aux_handle_actions
+
+    world._step(parallelize=True)
+
+    # the listener hears the first agent before the second one, although the second finished acting first
+    assert events.index("handled First") < events.index("handled Second")
+    assert listener.stimuli_count == 2
+    assert second.stimuli_count == 1
+
+
+def test_agents_affected_by_actions(setup):
+    from tinytroupe.agent import TinyPerson
+
+    world = TinyWorld("Affected land", [TinyPerson("Alice"), TinyPerson("Bob")])
+
+    assert world._agents_affected_by([{"type": "THINK", "content": "Hmm", "target": ""}]) == set()
+    assert world._agents_affected_by([{"type": "TALK", "content": "Hi", "target": "Bob"}]) == {"Bob"}
+
+    # messages to unknown targets might be broadcast to everyone
+    assert world._agents_affected_by([{"type": "TALK", "content": "Hi", "target": "Nobody"}]) is None
+
+
+def test_skipping_idle_agents(setup):
+    from tinytroupe.agent import TinyPerson
+
+    alice, bob = TinyPerson("Alice"), TinyPerson("Bob")
+    world = TinyWorld("Quiet land", [alice, bob], skip_idle_agents=True)
+
+    acted = []
+    _act_with(alice, [{"type": "DONE", "content": "", "target": ""}], before_returning=lambda: acted.append("Alice"))
+    _act_with(bob, [{"type": "DONE", "content": "", "target": ""}], before_returning=lambda: acted.append("Bob"))
+
+    world.run(1, parallelize=True)
+    assert sorted(acted) == ["Alice", "Bob"]
+
+    acted.clear()
+    alice.listen("Wake up, Alice!")
+    world.run(1, parallelize=True)
+    assert acted == ["Alice"]
+
+    acted.clear()
+    world.run(1, parallelize=False)
+    assert acted == []
+
+    stats = world.get_cost_stats()
+    assert stats["skipped_agent_acts"] == 3
+    assert stats["skipped_agent_acts_per_agent"] == {"Bob": 2, "Alice": 1}
+
+    # each step where agents acted has its latencies recorded
+    latency_stats = world.get_step_latency_stats()
+    assert [s["agents"] for s in latency_stats] == [2, 1]
+    assert latency_stats[0]["p50"] <= latency_stats[0]["p90"] <= latency_stats[0]["p99"] <= latency_stats[0]["max"]
+
+    # latencies are not part of the simulation state
+    assert "_step_latency_stats" not in world.encode_complete_state()
+
+
+def test_idle_agents_wake_up_periodically(setup):
+    from tinytroupe.agent import TinyPerson
+
+    alice = TinyPerson("Alice")
+
+    original_skip = config_manager.get("skip_idle_agents")
+    config_manager.update("skip_idle_agents", True)
+    try:
+        world = TinyWorld("Sleepy land", [alice], idle_agent_wake_up_interval=3)
+    finally:
+        config_manager.update("skip_idle_agents", original_skip)
+
+    acted_in_steps = []
+    _act_with(alice, [{"type": "DONE", "content": "", "target": ""}], before_returning=lambda: acted_in_steps.append(world._simulation_steps))
+
+    world.run(7, parallelize=False)
+
+    assert acted_in_steps == [1, 4, 7]
@@ -1,3 +1,4 @@
+import json
 import pytest
 from unittest.mock import MagicMock
 
@@ -7,7 +8,7 @@ sys.path.insert(0, '..')
 sys.path.insert(0, '../../')
 sys.path.insert(0, '../../tinytroupe/')
 
-from tinytroupe.utils import name_or_empty, extract_json, repeat_on_error
+from tinytroupe.utils import name_or_empty, extract_json, repeat_on_error, json_delta, apply_json_delta
 from testing_utils import *
 from tinytroupe.utils.llm import llm
 
@@ -238,3 +239,71 @@ def test_llm_decorator():
     response = lucky_number()
     print("Lucky number response:", response)
     assert isinstance(response, int)
+
+
+def test_json_delta():
+    old = {"agents": [{"name": "Oscar", "memory": [1, 2]}, {"name": "Lisa", "age": 28}, {"name": "Marcos"}], "factories": []}
+    new = {"agents": [{"name": "Oscar", "memory": [1, 2, 3]}, {"name": "Lisa", "age": 28}, {"name": "Marcos"}], "factories": [], "environments": None}
+
+    delta = json_delta(old, new)
+
+    assert apply_json_delta(old, delta) == new
+    assert apply_json_delta(new, json_delta(new, old)) == old
+    assert apply_json_delta(old, json_delta(old, old)) == old
+
+    # only what changed is in the delta, and the base is left untouched
+    assert "Lisa" not in json.dumps(delta)
+    assert old["agents"][0]["memory"] == [1, 2]
+
+    # values of different types are replaced, even if they compare as equal
+    assert apply_json_delta({"a": 1}, json_delta({"a": 1}, {"a": True})) == {"a": True}
+    assert apply_json_delta([1, 2, 3], json_delta([1, 2, 3], [4])) == [4]
+
+def test_action_repetition_detector():
+    import random
+    from tinytroupe.utils.behavior import ActionRepetitionDetector, _compute_single_action_jaccard_similarity
+
+    random.seed(42)
+    words = ["I", "think", "the", "new", "product", "is", "great", "café", "really", "not", "sure", ""]
+
+    def random_action():
+        return {"type": random.choice(["TALK", "THINK"]), "target": random.choice(["", "Lisa"]),
+                "content": " ".join(random.choices(words, k=random.randint(0, 8)))}
+
+    # the similarity must be exactly the same as textdistance's, against the last action or a window of them
+    detector = ActionRepetitionDetector(window_size=4)
+    actions = []
+    for _ in range(300):
+        proposed = random.choice([random_action(), dict(actions[-1]) if actions else random_action()])
+        if random.random() < 0.1:
+            del proposed["target"]
+
+        for window in [1, 4]:
+            expected = max([_compute_single_action_jaccard_similarity(action, proposed) for action in actions[-window:]],
+                           default=0.0)
+            assert detector.max_similarity(proposed, window=window) == pytest.approx(expected)
+
+        action = random_action()
+        detector.add(action)
+        actions.append(action)
+
+    # lists of proposed actions give the maximum similarity of any of them
+    assert detector.max_similarity([random_action(), dict(actions[-1])]) == 1.0
+    assert detector.max_similarity([]) == 0.0
+
+    detector.clear()
+    assert len(detector) == 0
+    assert detector.max_similarity(actions[-1]) == 0.0
+
+
+def test_action_repetition_detector_forgets_old_shingles():
+    from tinytroupe.utils.behavior import ActionRepetitionDetector
+
+    detector = ActionRepetitionDetector(window_size=2, shingle_length=3)
+    for i in range(3000):
+        detector.add({"type": "TALK", "target": "", "content": f"message number {i} of many"})
+
+    # the vocabulary only grows with the shingles of the actions kept, not with those of all actions seen
+    assert len(detector._vocabulary) <= 2 * ActionRepetitionDetector.MAX_VOCABULARY_SIZE
+    assert detector.max_similarity({"type": "TALK", "target": "", "content": "message number 2999 of many"}) == 1.0
+    assert detector.max_similarity({"type": "TALK", "target": "", "content": "message number 2997 of many"}) < 1.0
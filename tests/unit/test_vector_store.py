@@ -0,0 +1,144 @@
+import json
+import sys
+
+import numpy as np
+import pytest
+
+# Insert paths at the beginning of sys.path (position 0)
+sys.path.insert(0, "../../tinytroupe/")
+sys.path.insert(0, "../../")
+sys.path.insert(0, "..")
+
+from testing_utils import *
+
+from tinytroupe.agent.vector_store import NumpyVectorStore, SharedVectorStore
+
+
+def _store_with(vectors):
+    store = NumpyVectorStore()
+    store.add(list(range(len(vectors))), vectors, [(i, i + 1) for i in range(len(vectors))])
+    return store
+
+
+@pytest.mark.core
+def test_add_and_search():
+    store = _store_with([[1.0, 0.0], [0.0, 2.0], [1.0, 1.0]])
+
+    results = store.search([3.0, 0.1], top_k=2)
+
+    assert [memory_id for memory_id, _, _ in results] == [0, 2]
+    assert results[0][1] == (0, 1)
+    assert results[0][2] == pytest.approx(0.9994, abs=1e-3)
+    assert len(store.search([0.0, 1.0], top_k=10)) == 3
+
+
+def test_appends_grow_capacity_geometrically():
+    store = NumpyVectorStore()
+    capacities = set()
+    for i in range(100):
+        store.add([i], [[float(i), 1.0]])
+        capacities.add(len(store._ids_buffer))
+
+    assert len(store) == 100
+    assert store.ids.tolist() == list(range(100))
+    assert store.vectors.shape == (100, 2)
+    assert store.vectors.dtype == np.float32
+    assert capacities == {16, 32, 64, 128}
+
+
+def test_rejects_vectors_of_another_dimension():
+    store = _store_with([[1.0, 0.0]])
+
+    with pytest.raises(ValueError):
+        store.add([1], [[1.0, 0.0, 0.0]])
+
+
+def test_empty_store():
+    store = NumpyVectorStore()
+
+    assert len(store) == 0
+    assert store.search([1.0, 0.0]) == []
+
+
+def test_save_and_load(tmp_path):
+    store = _store_with([[1.0, 0.0], [0.0, 1.0]])
+    store.save(str(tmp_path))
+
+    loaded = NumpyVectorStore.load(str(tmp_path), mmap=True)
+
+    assert isinstance(loaded.vectors, np.memmap)
+    assert (loaded.vectors == store.vectors).all()
+    assert loaded.search([0.0, 1.0], top_k=1)[0][0] == 1
+
+    # appending to a memory-mapped store works on an in-memory copy, leaving the files untouched
+    loaded.add([2], [[1.0, 1.0]])
+    assert len(loaded) == 3
+    assert len(NumpyVectorStore.load(str(tmp_path))) == 2
+
+
+def test_json_serialization():
+    store = _store_with([[1.0, 0.0], [0.0, 1.0]])
+
+    restored = NumpyVectorStore.from_json(json.loads(json.dumps(store.to_json())))
+
+    assert (restored.vectors == store.vectors).all()
+    assert restored.ids.tolist() == [0, 1]
+    assert restored.spans.tolist() == [[0, 1], [1, 2]]
+
+    restored.add([2], [[1.0, 1.0]])
+    assert len(restored) == 3
+
+
+def test_shared_store_keeps_owners_apart():
+    shared_store = SharedVectorStore()
+    alice, bob = shared_store.view("Alice"), shared_store.view("Bob")
+
+    alice.add([0, 1], [[1.0, 0.0], [0.0, 1.0]], [(0, 5), (0, 7)])
+    bob.add([0], [[1.0, 0.1]])
+    alice.add([2], [[1.0, 1.0]])
+
+    assert len(shared_store) == 4
+    assert len(alice) == 3 and len(bob) == 1
+    assert alice.ids.tolist() == [0, 1, 2]
+    assert [memory_id for memory_id, _, _ in alice.search([1.0, 0.0], top_k=2)] == [0, 2]
+    assert bob.search([0.0, 1.0], top_k=5)[0][0] == 0
+
+
+def test_shared_store_batch_search():
+    shared_store = SharedVectorStore()
+    for i, owner in enumerate(["Alice", "Bob", "Carol"]):
+        shared_store.add(owner, [0, 1], [[1.0, float(i)], [float(i), 1.0]])
+
+    results = shared_store.search_batch(["Alice", "Carol", "Alice", "Nobody"], [[1.0, 0.0], [0.0, 1.0], [0.0, 1.0], [1.0, 0.0]], top_k=1)
+
+    assert [[memory_id for memory_id, _, _ in r] for r in results] == [[0], [0], [1], []]
+    assert results[0] == shared_store.search("Alice", [1.0, 0.0], top_k=1)
+
+
+def test_shared_store_remove_and_rename():
+    shared_store = SharedVectorStore()
+    shared_store.add("Alice", [0, 1], [[1.0, 0.0], [0.0, 1.0]])
+    shared_store.add("Bob", [0], [[1.0, 1.0]])
+    shared_store.add("Alice", [2], [[1.0, 1.0]])
+
+    shared_store.remove("Alice")
+    assert len(shared_store) == 1
+    assert shared_store.owners() == ["Bob"]
+    assert shared_store.search("Bob", [1.0, 1.0])[0][2] == pytest.approx(1.0)
+
+    shared_store.rename_owner("Bob", "Robert")
+    assert shared_store.count("Bob") == 0
+    assert shared_store.count("Robert") == 1
+
+
+def test_shared_store_view_serializes_as_standalone_store():
+    shared_store = SharedVectorStore()
+    view = shared_store.view("Alice")
+    view.add([0, 1], [[1.0, 0.0], [0.0, 1.0]])
+    shared_store.add("Bob", [0], [[1.0, 1.0]])
+
+    restored = NumpyVectorStore.from_json(json.loads(json.dumps(view.to_json())))
+
+    assert isinstance(restored, NumpyVectorStore)
+    assert restored.ids.tolist() == [0, 1]
+    assert (restored.vectors == view.vectors).all()